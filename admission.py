@@ -0,0 +1,132 @@
+import os
+import json
+import math
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows下没有fcntl，预算只在进程内生效
+    fcntl = None
+
+from glyph_cache import text_polygons
+from render_jobs import pid_alive
+
+# 每条路径的固定开销，折算成顶点数（matplotlib后端每条路径一个线条对象）
+PATH_COST = 20
+
+# 每个成本单位的渲染耗时（秒）的初始估计，之后按实际完成的任务更新
+INITIAL_SECONDS_PER_UNIT = 2e-5
+# 耗时估计的指数平滑系数
+SMOOTHING = 0.2
+
+# Retry-After的上下限（秒）
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 300
+
+# 请求参数的取值范围，与界面上的控件一致；超出范围的请求不估算成本，直接拒绝
+SIZE_RANGE = (10, 200)
+DURATION_RANGE = (1.0, 20.0)
+
+
+def estimate_cost(params):
+    """
+    渲染成本 = 帧数 × (顶点数 + PATH_COST × 路径数)。
+    多边形来自字形缓存，估算本身只相当于一次text_to_paths。
+    """
+    paths = text_polygons(params['text'], params['font'], params['size'])
+    vertices = sum(len(path) for path in paths)
+    frames = int(params['duration'] * params['fps'])
+    return frames * (vertices + PATH_COST * len(paths))
+
+
+class AdmissionController:
+    """
+    按成本限制同时进行的渲染。
+    正在进行的任务成本之和加上新任务超过budget时拒绝，并根据平均渲染速度估计多久后可以重试；
+    没有任务在进行时总是接受。成本超过max_cost（默认等于budget）的任务在任何时候都不接受。
+    ledger_path指定时，进行中的任务登记在这个文件中（flock加锁），同一台机器上的所有web进程共享预算；
+    否则只统计本进程的任务。登记任务的进程退出后，它的任务随之失效（它的渲染进程也已退出）。
+    """
+
+    def __init__(self, budget, workers=1, max_cost=None, ledger_path=None):
+        self.budget = budget
+        self.max_cost = budget if max_cost is None else max_cost
+        # 每个web进程的渲染进程数
+        self.workers = max(1, workers)
+        self.ledger_path = ledger_path if fcntl is not None else None
+        if self.ledger_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.ledger_path)), exist_ok=True)
+        self.seconds_per_unit = INITIAL_SECONDS_PER_UNIT
+        self._costs = {}  # 不使用共享文件时的任务表：任务ID -> [成本, 登记的进程]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _ledger(self):
+        """加锁取出进行中的任务表 {任务ID: [成本, 登记的进程]}，代码块中的修改在退出时写回"""
+        with self._lock:
+            if self.ledger_path is None:
+                yield self._costs
+                return
+            with open(self.ledger_path, 'a+') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    try:
+                        costs = json.load(f)
+                    except ValueError:
+                        costs = {}
+                    costs = {job_id: entry for job_id, entry in costs.items() if pid_alive(entry[1])}
+                    yield costs
+                    f.seek(0)
+                    f.truncate()
+                    json.dump(costs, f)
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def too_large(self, cost):
+        """成本超过单个任务的上限"""
+        return cost > self.max_cost
+
+    def try_admit(self, job_id, cost):
+        """接受时返回(True, 0)，拒绝时返回(False, 建议的重试秒数)；同一任务重复提交不重复计费"""
+        with self._ledger() as costs:
+            if job_id in costs:
+                return True, 0
+            load = sum(entry[0] for entry in costs.values())
+            if costs and load + cost > self.budget:
+                return False, self._retry_after(load + cost - self.budget, costs)
+            costs[job_id] = [cost, os.getpid()]
+            return True, 0
+
+    def _retry_after(self, excess, costs):
+        # 需要等正在进行的任务完成excess这么多成本，由登记了任务的各web进程的渲染进程并行处理
+        processes = len({entry[1] for entry in costs.values()}) or 1
+        seconds = excess * self.seconds_per_unit / (self.workers * processes)
+        return int(min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, math.ceil(seconds))))
+
+    def release(self, job_id, seconds=None):
+        """任务结束时释放其成本；seconds为实际渲染耗时，用于更新本进程的速度估计"""
+        with self._ledger() as costs:
+            entry = costs.pop(job_id, None)
+            if entry and seconds:
+                self.seconds_per_unit += SMOOTHING * (seconds / entry[0] - self.seconds_per_unit)
+
+    def load(self):
+        """正在进行的任务成本之和"""
+        with self._ledger() as costs:
+            return sum(entry[0] for entry in costs.values())
+
+    def in_flight(self):
+        """进行中的任务数；使用共享文件时包括所有web进程"""
+        with self._ledger() as costs:
+            return len(costs)
+
+    def over_budget(self):
+        """已用满预算时返回建议的重试秒数，否则返回0"""
+        with self._ledger() as costs:
+            load = sum(entry[0] for entry in costs.values())
+            if load < self.budget:
+                return 0
+            return self._retry_after(load - self.budget + 1, costs)
@@ -1,19 +1,49 @@
 import os
-import base64
-import uuid
-from io import BytesIO
-from flask import Flask, render_template, request, jsonify, send_file, url_for
+import re
+import math
+import time
+import tempfile
+import json
+import mimetypes
+from urllib.parse import quote
+from flask import (Flask, Response, g, render_template, request, jsonify, send_from_directory,
+                   stream_with_context, url_for)
+from werkzeug.security import safe_join
 from flask_cors import CORS
-import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from matplotlib.textpath import TextPath
-from matplotlib.font_manager import FontProperties
-from matplotlib.transforms import Affine2D
+from text_animation import TextAnimation, DEFAULT_FPS, BACKENDS, SPRITE_FRAMES, SPRITE_COLUMNS
+from ffmpeg_pipe import EncoderSettings
+from render_cache import normalize_params, normalize_preview_params, cache_key
+from render_jobs import JobQueue, DONE, FAILED
+from storage import StorageManager
+from metrics import Registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from glyph_cache import text_polygons, glyph_cache
+from font_index import font_index
+from vector_export import VECTOR_FORMATS, animated_svg, lottie_json, static_svg
+from batch import run_batch, MAX_BATCH_ITEMS
+from admission import AdmissionController, estimate_cost, SIZE_RANGE, DURATION_RANGE
 
 # 获取环境变量或使用默认值
 DEBUG = os.environ.get('DEBUG', 'False').lower() == 'true'
 PORT = int(os.environ.get('PORT', 8000))
+# 每个web进程可同时运行的渲染进程数
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', 2))
+# 同一台机器上所有web进程同时进行的渲染任务的成本上限（帧数×顶点数，见admission.estimate_cost）
+RENDER_COST_BUDGET = int(os.environ.get('RENDER_COST_BUDGET', 3000000))
+# 单个渲染任务的成本上限，超过时返回413；默认与总预算相同
+RENDER_MAX_COST = int(os.environ.get('RENDER_MAX_COST', RENDER_COST_BUDGET))
+# 每个渲染任务内部分段并行渲染的进程数
+RENDER_CHUNK_WORKERS = int(os.environ.get('RENDER_CHUNK_WORKERS', 1))
+
+# 增量渲染：每帧只绘制新出现的线段
+RENDER_INCREMENTAL = os.environ.get('RENDER_INCREMENTAL', 'True').lower() == 'true'
+
+# 视频编码参数
+ENCODER = EncoderSettings.from_env()
+
+# 设置后下载由nginx完成：响应只带X-Accel-Redirect头，值为该前缀加文件名（如 /protected_uploads/）
+ACCEL_REDIRECT_PREFIX = os.environ.get('ACCEL_REDIRECT_PREFIX', '')
+# 视频文件名包含参数哈希，同名文件内容不变，可以长时间缓存
+VIDEO_MAX_AGE = 7 * 86400
 
 app = Flask(__name__)
 # 启用CORS，允许所有来源的跨域请求
@@ -23,165 +53,203 @@ CORS(app)
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-class TextAnimation:
-    def __init__(self):
-        self.fig, self.ax = plt.subplots(figsize=(10, 6), facecolor='black')
-        self.ax.set_facecolor('black')
-        self.ax.set_xlim(0, 10)
-        self.ax.set_ylim(0, 6)
-        self.ax.axis('off')
-        
-        # 动画参数
-        self.text = "Hello"
-        self.font_name = "Arial"
-        self.font_size = 72
-        self.line_color = 'white'
-        self.duration = 5  # 动画持续时间（秒）
-        self.fps = 30      # 帧率
-        self.frames = self.duration * self.fps
-        self.line_width = 2
-        
-        # 路径点和动画状态
-        self.paths = []
-        self.points = []
-        self.lines = []
-        
-    def text_to_paths(self):
-        """将文本转换为路径点"""
-        font_prop = FontProperties(family=self.font_name, size=self.font_size)
-        text_path = TextPath((0, 0), self.text, prop=font_prop)
-        
-        # 获取文本边界以便居中
-        text_bounds = text_path.get_extents()
-        width = text_bounds.width
-        height = text_bounds.height
-        
-        # 创建变换以居中文本
-        transform = Affine2D().translate(5 - width/2, 3 - height/2)
-        text_path = transform.transform_path(text_path)
-        
-        # 提取路径点
-        self.paths = []
-        for path in text_path.to_polygons():
-            if len(path) > 2:  # 确保路径至少有3个点
-                self.paths.append(path)
-        
-        # 为每个路径创建点和线条
-        self.points = [np.zeros((1, 2)) for _ in self.paths]
-        self.lines = [self.ax.plot([], [], color=self.line_color, lw=self.line_width)[0] 
-                     for _ in self.paths]
-    
-    def init_animation(self):
-        """初始化动画"""
-        for line in self.lines:
-            line.set_data([], [])
-        return self.lines
-    
-    def animate(self, i):
-        """更新每一帧的动画"""
-        progress = i / self.frames
-        
-        for j, path in enumerate(self.paths):
-            # 计算当前应该显示的点数
-            path_progress = min(1.0, max(0, (progress * 1.5) - (j * 0.05)))
-            if path_progress <= 0:
-                continue
-                
-            points_to_show = int(path_progress * len(path))
-            if points_to_show > 0:
-                self.points[j] = path[:points_to_show]
-                self.lines[j].set_data(self.points[j][:, 0], self.points[j][:, 1])
-        
-        return self.lines
-    
-    def create_animation(self):
-        """创建动画对象"""
-        self.text_to_paths()
-        anim = animation.FuncAnimation(self.fig, self.animate, frames=self.frames,
-                                      init_func=self.init_animation, blit=True)
-        return anim
-    
-    def save_animation(self, output_path="apple_text_animation.mp4"):
-        """保存动画为视频文件"""
-        anim = self.create_animation()
-        
-        # 直接使用matplotlib保存为MP4
-        plt.close(self.fig)  # 避免显示图形
-        
-        # 使用FFMpegWriter保存为MP4
-        writer = animation.FFMpegWriter(fps=self.fps, metadata=dict(artist='Me'), bitrate=1800)
-        anim.save(output_path, writer=writer)
-        
-        return output_path
-    
-    def generate_preview_image(self):
-        """生成预览图像"""
-        # 清除当前图形
-        self.ax.clear()
-        self.ax.set_facecolor('black')
-        self.ax.set_xlim(0, 10)
-        self.ax.set_ylim(0, 6)
-        self.ax.axis('off')
-        
-        # 创建文本路径
-        font_prop = FontProperties(family=self.font_name, size=self.font_size)
-        text_path = TextPath((0, 0), self.text, prop=font_prop)
-        
-        # 获取文本边界以便居中
-        text_bounds = text_path.get_extents()
-        width = text_bounds.width
-        height = text_bounds.height
-        
-        # 创建变换以居中文本
-        transform = Affine2D().translate(5 - width/2, 3 - height/2)
-        text_path = transform.transform_path(text_path)
-        
-        # 绘制文本轮廓
-        for path in text_path.to_polygons():
-            if len(path) > 2:
-                x, y = path[:, 0], path[:, 1]
-                self.ax.plot(x, y, color='white', lw=2)
-        
-        # 将图形转换为base64编码的图像
-        buffer = BytesIO()
-        self.fig.savefig(buffer, format='png', facecolor='black')
-        buffer.seek(0)
-        image_data = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        
-        return image_data
-        
-    def set_text(self, text):
-        """设置要动画的文本"""
-        self.text = text
-        
-    def set_font(self, font_name, font_size):
-        """设置字体和大小"""
-        self.font_name = font_name
-        self.font_size = font_size
-        
-    def set_duration(self, duration):
-        """设置动画持续时间"""
-        self.duration = duration
-        self.frames = self.duration * self.fps
+# 任务状态目录，放在临时目录中以便同一台机器上的所有web worker共享
+JOBS_FOLDER = os.environ.get('JOBS_FOLDER', os.path.join(tempfile.gettempdir(), 'text_animation_jobs'))
+
+# 监控指标：记录只在任务结束时发生，格式化只在/metrics被抓取时进行；
+# 各进程的数据写在任务状态目录下，任何一个web worker被抓取时都输出所有worker的汇总
+metrics = Registry(shared_dir=os.path.join(JOBS_FOLDER, 'metrics'))
+STAGE_SECONDS = metrics.histogram('text_animation_stage_seconds', '渲染各阶段耗时（秒）', ('stage',))
+RENDER_SECONDS = metrics.histogram('text_animation_render_seconds', '渲染任务总耗时（秒）')
+PATHS_PER_RENDER = metrics.histogram('text_animation_paths', '每个渲染任务的路径数',
+                                     buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+VERTICES = metrics.counter('text_animation_vertices', '路径简化前后的顶点数', ('stage',))
+FRAMES_RENDERED = metrics.counter('text_animation_frames_rendered', '已渲染的帧数')
+BYTES_WRITTEN = metrics.counter('text_animation_output_bytes', '写出的视频字节数')
+JOBS_FINISHED = metrics.counter('text_animation_jobs', '结束的渲染任务数', ('status',))
+ADMISSION_REJECTED = metrics.counter('text_animation_admission_rejected', '因超出成本预算被拒绝的请求数')
+
+# 准入控制：按估计成本限制同时进行的渲染，超出时返回429；
+# 进行中的任务登记在任务状态目录下的共享文件中，所有web worker共用一个预算
+admission = AdmissionController(RENDER_COST_BUDGET, workers=RENDER_WORKERS,
+                                max_cost=RENDER_MAX_COST,
+                                ledger_path=os.path.join(JOBS_FOLDER, 'admission.json'))
+metrics.gauge('text_animation_cost_in_flight', '进行中的渲染任务的成本之和', admission.load)
+metrics.gauge('text_animation_cost_budget', '渲染成本预算', lambda: admission.budget)
+
+def record_job(job_id, result, error):
+    """渲染任务结束时释放准入成本并记录监控指标"""
+    admission.release(job_id, result['seconds'] if result and not result['cached'] else None)
+    if error is not None:
+        JOBS_FINISHED.inc(status=FAILED)
+        return
+    JOBS_FINISHED.inc(status='cached' if result['cached'] else DONE)
+    if result['cached']:
+        return
+    RENDER_SECONDS.observe(result['seconds'])
+    for stage, seconds in result['timings'].items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+    counters = result['counters']
+    PATHS_PER_RENDER.observe(counters.get('paths', 0))
+    VERTICES.inc(counters.get('vertices_in', 0), stage='input')
+    VERTICES.inc(counters.get('vertices', 0), stage='simplified')
+    FRAMES_RENDERED.inc(counters.get('frames', 0))
+    BYTES_WRITTEN.inc(counters.get('bytes', 0))
+
+# 渲染任务队列：相同参数直接复用已生成的视频，新任务交给后台渲染进程
+job_queue = JobQueue(UPLOAD_FOLDER, JOBS_FOLDER, max_workers=RENDER_WORKERS,
+                     chunk_workers=RENDER_CHUNK_WORKERS, on_complete=record_job)
+metrics.gauge('text_animation_renders_in_flight', '所有web进程中排队或渲染中的任务数',
+              admission.in_flight)
+
+# 本进程的启动耗时（由gunicorn.conf.py的post_worker_init填写）和第一个请求的耗时
+worker_stats = {}
+metrics.gauge('text_animation_worker_boot_seconds', 'worker从fork到可以处理请求的耗时（秒）',
+              lambda: worker_stats.get('boot_seconds', 0), per_process=True)
+metrics.gauge('text_animation_first_request_seconds', '各进程第一个请求的耗时（秒）',
+              lambda: worker_stats.get('first_request_seconds', 0), per_process=True)
+
+# 本进程（预览、矢量导出和成本估算）的字形缓存；渲染进程各有自己的缓存，不在这里统计
+metrics.gauge('text_animation_glyph_cache_hits', '字形缓存命中次数',
+              lambda: glyph_cache.stats()['hits'], per_process=True)
+metrics.gauge('text_animation_glyph_cache_misses', '字形缓存未命中次数',
+              lambda: glyph_cache.stats()['misses'], per_process=True)
+metrics.gauge('text_animation_glyph_cache_entries', '字形缓存中的条目数',
+              lambda: glyph_cache.stats()['entries'], per_process=True)
+
+# 输出目录的容量上限（字节）和未访问视频的最长保留时间（秒），后台线程定期按LRU清理
+STORAGE_MAX_BYTES = int(os.environ.get('STORAGE_MAX_BYTES', 2 * 1024 ** 3))
+STORAGE_MAX_AGE = int(os.environ.get('STORAGE_MAX_AGE', 7 * 86400))
+STORAGE_SCAN_INTERVAL = int(os.environ.get('STORAGE_SCAN_INTERVAL', 60))
+storage = StorageManager(job_queue.cache, STORAGE_MAX_BYTES, STORAGE_MAX_AGE,
+                         interval=STORAGE_SCAN_INTERVAL, jobs_folder=JOBS_FOLDER)
+
+JOB_ID_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+# 启动时加载（或构建并保存）字体索引，请求中的字体名直接查表校验
+font_index.load()
+DEFAULT_FONT = font_index.default_family()
+
+# /generate支持的输出格式：mp4走后台渲染任务，矢量格式直接返回
+OUTPUT_FORMATS = ('mp4',) + VECTOR_FORMATS
+
+@app.before_request
+def start_storage_janitor():
+    # 在处理请求的进程中启动清理线程（gunicorn预加载时master进程里的线程不会被fork）
+    storage.start()
+    if 'first_request_seconds' not in worker_stats:
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def record_first_request(response):
+    started = g.get('request_started')
+    if started is not None and 'first_request_seconds' not in worker_stats:
+        worker_stats['first_request_seconds'] = time.perf_counter() - started
+        app.logger.info(f"进程 {os.getpid()} 第一个请求 {request.path} 耗时 "
+                        f"{worker_stats['first_request_seconds'] * 1000:.1f}ms")
+        metrics.flush()
+    return response
 
 @app.route('/')
 def index():
     return render_template('index.html', title="文字动画生成器")
 
+# 预览图格式；sprite为描绘过程的关键帧拼图
+PREVIEW_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml', 'sprite': 'image/png'}
+# 关键帧拼图最多的帧数
+MAX_SPRITE_FRAMES = 32
+# 预览图内容完全由参数决定，允许浏览器和CDN缓存
+PREVIEW_MAX_AGE = 86400
+
+class ParameterError(ValueError):
+    """请求参数不合法，由错误处理器转换为400响应"""
+    status = 400
+
+class CostTooHigh(ParameterError):
+    """估计的渲染成本超过单个任务的上限"""
+    status = 413
+
+@app.errorhandler(ParameterError)
+def parameter_error(e):
+    return jsonify({'error': str(e)}), e.status
+
+def _number(values, name, default, convert=int, low=None, high=None):
+    """读取数值参数；不是有限的数字或不在[low, high]范围内时抛出ParameterError"""
+    try:
+        value = convert(values.get(name, default))
+    except (TypeError, ValueError):
+        raise ParameterError(f"参数{name}必须是数字")
+    if not math.isfinite(value):
+        raise ParameterError(f"参数{name}必须是数字")
+    if (low is not None and value < low) or (high is not None and value > high):
+        raise ParameterError(f"参数{name}应在{low}到{high}之间")
+    return value
+
+@app.route('/fonts')
+def fonts():
+    # 可选字体列表来自字体索引，不重新扫描系统字体
+    return jsonify({'fonts': font_index.families(), 'default': DEFAULT_FONT})
+
+@app.route('/preview', methods=['GET'])
+def preview_image():
+    # 参数放在查询字符串中，返回可缓存的图片字节
+    text = request.args.get('text', 'Hello')
+    font_name = request.args.get('font', DEFAULT_FONT)
+    font_size = _number(request.args, 'size', 72, int, *SIZE_RANGE)
+    if font_name not in font_index:
+        return jsonify({'error': f"未知字体: {font_name}"}), 400
+    image_format = request.args.get('format', 'png')
+    if image_format not in PREVIEW_FORMATS:
+        return jsonify({'error': f"不支持的预览格式: {image_format}"}), 400
+    duration = frames = None
+    if image_format == 'sprite':
+        duration = _number(request.args, 'duration', 5.0, float, *DURATION_RANGE)
+        frames = _number(request.args, 'frames', SPRITE_FRAMES, int, 1, MAX_SPRITE_FRAMES)
+    
+    # 强ETag由规范化参数决定，命中时不再渲染
+    etag = cache_key(normalize_preview_params(text, font_name, font_size, image_format,
+                                              duration, frames))
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif image_format == 'svg':
+        response = Response(static_svg(text_polygons(text, font_name, font_size)),
+                            mimetype=PREVIEW_FORMATS['svg'])
+    elif image_format == 'sprite':
+        with TextAnimation() as animator:
+            animator.set_text(text)
+            animator.set_font(font_name, font_size)
+            animator.set_duration(duration)
+            sheet, indexes = animator.render_sprite_sheet(frames)
+        response = Response(sheet, mimetype=PREVIEW_FORMATS['sprite'])
+        # 每个格子对应的时间（秒），按行排列，每行SPRITE_COLUMNS格
+        response.headers['X-Sprite-Times'] = ','.join(f"{i / DEFAULT_FPS:.2f}" for i in indexes)
+        response.headers['X-Sprite-Columns'] = str(SPRITE_COLUMNS)
+    else:
+        with TextAnimation() as animator:
+            animator.set_text(text)
+            animator.set_font(font_name, font_size)
+            response = Response(animator.render_preview(), mimetype=PREVIEW_FORMATS['png'])
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = PREVIEW_MAX_AGE
+    return response
+
 @app.route('/preview', methods=['POST'])
 def preview():
     # 获取表单数据
     text = request.form.get('text', 'Hello')
-    font_name = request.form.get('font', 'Arial')
-    font_size = int(request.form.get('size', 72))
-    
-    # 创建动画对象并设置参数
-    animator = TextAnimation()
-    animator.set_text(text)
-    animator.set_font(font_name, font_size)
+    font_name = request.form.get('font', DEFAULT_FONT)
+    font_size = _number(request.form, 'size', 72, int, *SIZE_RANGE)
+    if font_name not in font_index:
+        return jsonify({'error': f"未知字体: {font_name}"}), 400
     
-    # 生成预览图像
-    preview_image = animator.generate_preview_image()
+    # 创建动画对象并设置参数，结束后归还图形
+    with TextAnimation() as animator:
+        animator.set_text(text)
+        animator.set_font(font_name, font_size)
+        
+        # 生成预览图像
+        preview_image = animator.generate_preview_image()
     
     return jsonify({'preview_image': preview_image})
 
@@ -190,42 +258,217 @@ def generate():
     try:
         # 获取表单数据
         text = request.form.get('text', 'Hello')
-        font_name = request.form.get('font', 'Arial')
-        font_size = int(request.form.get('size', 72))
-        duration = float(request.form.get('duration', 5.0))
-        
-        # 创建动画对象并设置参数
-        animator = TextAnimation()
-        animator.set_text(text)
-        animator.set_font(font_name, font_size)
-        animator.set_duration(duration)
+        font_name = request.form.get('font', DEFAULT_FONT)
+        font_size = _number(request.form, 'size', 72, int, *SIZE_RANGE)
+        if font_name not in font_index:
+            return jsonify({'error': f"未知字体: {font_name}"}), 400
+        duration = _number(request.form, 'duration', 5.0, float, *DURATION_RANGE)
+        backend = request.form.get('backend', 'matplotlib')
+        if backend not in BACKENDS:
+            return jsonify({'error': f"不支持的渲染后端: {backend}"}), 400
+        output_format = request.form.get('format', 'mp4')
+        if output_format not in OUTPUT_FORMATS:
+            return jsonify({'error': f"不支持的输出格式: {output_format}"}), 400
+        if output_format in VECTOR_FORMATS:
+            return _vector_response(text, font_name, font_size, duration, output_format)
         
-        # 生成唯一文件名
-        filename = f"animation_{uuid.uuid4().hex}.mp4"
-        output_path = os.path.join(UPLOAD_FOLDER, filename)
+        params = normalize_params(text, font_name, font_size, duration, DEFAULT_FPS,
+                                  ENCODER.to_dict(), backend, RENDER_INCREMENTAL)
         
-        # 确保上传目录存在
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # 保存动画
-        try:
-            animator.save_animation(output_path)
-        except Exception as e:
-            # 检查是否是FFmpeg相关错误
-            if 'ffmpeg' in str(e).lower():
-                return jsonify({'error': 'FFmpeg未安装或不可用。请安装FFmpeg后再试。'}), 500
-            raise
-        
-        # 返回视频文件URL
-        video_url = url_for('static', filename=f'uploads/{filename}')
-        return jsonify({'video_url': video_url})
+        # 提交渲染任务，立即返回任务ID
+        job_id, retry_after = _submit(params)
+        if job_id is None:
+            return _busy_response(retry_after)
+        return _job_response(job_id, job_queue.status(job_id), 202)
+    except ParameterError:
+        raise
     except Exception as e:
         app.logger.error(f"视频生成错误: {str(e)}")
         return jsonify({'error': f"视频生成失败: {str(e)}"}), 500
 
+# /stream输出分片MP4，每个分片0.5秒，第一个分片编码完成后浏览器就可以开始播放
+STREAM_ENCODER = EncoderSettings.from_dict(dict(ENCODER.to_dict(), fragment_seconds=0.5))
+# 读取正在写入的视频时每次发送的最大字节数，以及没有新数据时的等待间隔（秒）
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_POLL_INTERVAL = 0.05
+
+@app.route('/stream', methods=['GET'])
+def stream_video():
+    # 参数放在查询字符串中，可以直接作为<video>的src；边渲染边以分块响应发送
+    text = request.args.get('text', 'Hello')
+    font_name = request.args.get('font', DEFAULT_FONT)
+    font_size = _number(request.args, 'size', 72, int, *SIZE_RANGE)
+    if font_name not in font_index:
+        return jsonify({'error': f"未知字体: {font_name}"}), 400
+    duration = _number(request.args, 'duration', 5.0, float, *DURATION_RANGE)
+    backend = request.args.get('backend', 'matplotlib')
+    if backend not in BACKENDS:
+        return jsonify({'error': f"不支持的渲染后端: {backend}"}), 400
+    
+    # 分片MP4与/generate的普通MP4缓存键不同；完整文件同样保存在输出目录中供之后下载
+    params = normalize_params(text, font_name, font_size, duration, DEFAULT_FPS,
+                              STREAM_ENCODER.to_dict(), backend, RENDER_INCREMENTAL)
+    job_id, retry_after = _submit(params)
+    if job_id is None:
+        return _busy_response(retry_after)
+    
+    response = Response(stream_with_context(_follow_video(job_id)), mimetype='video/mp4')
+    response.headers['X-Job-Id'] = job_id
+    response.headers['X-Status-Url'] = url_for('job_status', job_id=job_id)
+    response.cache_control.no_store = True
+    # 让nginx等反向代理不缓冲响应，分片一写出就转发给客户端
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _follow_video(job_id):
+    """
+    跟随渲染任务读取视频：先读正在写入的临时文件，写完后读到文件末尾为止。
+    临时文件被改名为最终文件名后，已打开的文件描述符仍指向同一个文件。
+    任务失败时结束响应，客户端收到的是不完整的视频。
+    """
+    f = None
+    try:
+        while True:
+            state = job_queue.status(job_id)
+            if state is None or state['status'] == FAILED:
+                return
+            done = state['status'] == DONE
+            if f is None:
+                name = state['filename'] if done else state.get('partial')
+                if name:
+                    try:
+                        f = open(os.path.join(UPLOAD_FOLDER, name), 'rb')
+                    except FileNotFoundError:
+                        pass  # ffmpeg还没有创建文件，或者临时文件刚被改名
+            if f is not None:
+                chunk = f.read(STREAM_CHUNK_SIZE)
+                if chunk:
+                    yield chunk
+                    continue
+                if done:
+                    return
+            time.sleep(STREAM_POLL_INTERVAL)
+    finally:
+        if f is not None:
+            f.close()
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    # 请求体为JSON：{"items": [{"text": ..., "font": ..., "size": ..., "duration": ..., "backend": ...}, ...]}
+    body = request.get_json(silent=True) or {}
+    items = body.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': '请求体需要包含非空的items列表'}), 400
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({'error': f"一次最多提交{MAX_BATCH_ITEMS}项"}), 400
+    # 预算已用满时要求稍后重试；开始后每一项提交前按估计成本计费，预算不足时暂缓提交
+    retry_after = admission.over_budget()
+    if retry_after:
+        return _busy_response(retry_after)
+    
+    def stream():
+        # 每完成一项输出一行JSON（NDJSON），最后一行是汇总
+        for result in run_batch(job_queue, items, ENCODER, RENDER_INCREMENTAL, submit=_submit):
+            if result.get('filename'):
+                result['video_url'] = url_for('static', filename=f"uploads/{result['filename']}")
+            yield json.dumps(result, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    state = job_queue.status(job_id) if JOB_ID_PATTERN.fullmatch(job_id) else None
+    if state is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return _job_response(job_id, state, 200)
+
+def _vector_response(text, font_name, font_size, duration, output_format):
+    """矢量格式不需要光栅化和编码，直接由多边形生成动画描述"""
+    paths = text_polygons(text, font_name, font_size)
+    if output_format == 'svg':
+        return Response(animated_svg(paths, duration), mimetype='image/svg+xml')
+    return Response(lottie_json(paths, duration, DEFAULT_FPS, name=text),
+                    mimetype='application/json')
+
+def _submit(params):
+    """
+    提交渲染任务，返回(任务ID, 0)；超出成本预算时返回(None, 建议的重试秒数)。
+    已缓存的视频不占用预算；新任务先估计成本，超过单个任务的上限时抛出CostTooHigh，
+    超出预算时让客户端稍后重试。
+    """
+    job_id = cache_key(params)
+    if not job_queue.cache.lookup(job_id):
+        cost = estimate_cost(params)
+        if admission.too_large(cost):
+            raise CostTooHigh(f"渲染成本{cost}超过上限{admission.max_cost}，请缩短文字、减小字号或时长")
+        admitted, retry_after = admission.try_admit(job_id, cost)
+        if not admitted:
+            return None, retry_after
+    try:
+        job_queue.submit(params)
+    except Exception:
+        admission.release(job_id)
+        raise
+    if job_queue.status(job_id)['status'] == DONE:
+        admission.release(job_id)  # 提交时发现其他进程已经渲染完成
+    return job_id, 0
+
+def _busy_response(retry_after):
+    """超出渲染成本预算时的429响应"""
+    ADMISSION_REJECTED.inc()
+    response = jsonify({'error': '服务器繁忙，请稍后重试', 'retry_after': retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def _job_response(job_id, state, code):
+    """把任务状态转换为JSON响应"""
+    body = {
+        'job_id': job_id,
+        'status': state['status'],
+        'frames_done': state.get('frames_done', 0),
+        'frames_total': state.get('frames_total', 0),
+        'status_url': url_for('job_status', job_id=job_id),
+    }
+    if state['status'] == DONE:
+        body['video_url'] = url_for('static', filename=f"uploads/{state['filename']}")
+        code = 200
+    elif state['status'] == FAILED:
+        error = state.get('error', '')
+        # 检查是否是FFmpeg相关错误
+        if 'ffmpeg' in error.lower():
+            body['error'] = 'FFmpeg未安装或不可用。请安装FFmpeg后再试。'
+        else:
+            body['error'] = f"视频生成失败: {error}"
+    return jsonify(body), code
+
 @app.route('/download/<filename>')
 def download(filename):
-    return send_file(os.path.join(UPLOAD_FOLDER, filename), as_attachment=True)
+    path = safe_join(UPLOAD_FOLDER, filename)
+    if path is None or not os.path.isfile(path):
+        return jsonify({'error': '文件不存在'}), 404
+    key = job_queue.cache.key_of(filename)
+    if key is not None:
+        job_queue.cache.touch(key)
+    if ACCEL_REDIRECT_PREFIX:
+        # 交给nginx用sendfile发送，Range和条件请求也由nginx处理
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + quote(filename)
+        response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+        return response
+    # 支持Range（视频拖动）、ETag/Last-Modified条件请求
+    return send_from_directory(UPLOAD_FOLDER, filename, as_attachment=True,
+                               conditional=True, max_age=VIDEO_MAX_AGE)
+
+@app.route('/storage')
+def storage_usage():
+    # 输出目录当前占用（最近一次清理时统计）
+    return jsonify(storage.usage())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Prometheus文本格式
+    return Response(metrics.expose(), content_type=METRICS_CONTENT_TYPE)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=PORT, debug=DEBUG)
\ No newline at end of file
@@ -2,13 +2,13 @@ import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import matplotlib.patheffects as path_effects
-from matplotlib.textpath import TextPath
-from matplotlib.font_manager import FontProperties
-from matplotlib.transforms import Affine2D
-import moviepy.editor as mpy
+from glyph_cache import text_polygons
+from font_index import font_index
 import os
+import tempfile
+from text_animation import TextAnimation
 import tkinter as tk
-from tkinter import ttk, font
+from tkinter import ttk
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
 class AppleTextAnimation:
@@ -36,23 +36,8 @@ class AppleTextAnimation:
         
     def text_to_paths(self):
         """将文本转换为路径点"""
-        font_prop = FontProperties(family=self.font_name, size=self.font_size)
-        text_path = TextPath((0, 0), self.text, prop=font_prop)
-        
-        # 获取文本边界以便居中
-        text_bounds = text_path.get_extents()
-        width = text_bounds.width
-        height = text_bounds.height
-        
-        # 创建变换以居中文本
-        transform = Affine2D().translate(5 - width/2, 3 - height/2)
-        text_path = transform.transform_path(text_path)
-        
-        # 提取路径点
-        self.paths = []
-        for path in text_path.to_polygons():
-            if len(path) > 2:  # 确保路径至少有3个点
-                self.paths.append(path)
+        # 从字形缓存中取出居中后的多边形（至少3个点）
+        self.paths = text_polygons(self.text, self.font_name, self.font_size)
         
         # 为每个路径创建点和线条
         self.points = [np.zeros((1, 2)) for _ in self.paths]
@@ -90,22 +75,33 @@ class AppleTextAnimation:
         return anim
     
     def save_animation(self, output_path="apple_text_animation.mp4"):
-        """保存动画为视频文件"""
-        anim = self.create_animation()
-        
-        # 使用moviepy保存为视频
-        plt.close(self.fig)  # 避免显示图形
-        
-        # 创建临时GIF文件
-        temp_gif = "temp_animation.gif"
-        anim.save(temp_gif, writer='pillow', fps=self.fps, dpi=100)
-        
-        # 转换为MP4
-        clip = mpy.VideoFileClip(temp_gif)
-        clip.write_videofile(output_path, fps=self.fps)
-        
-        # 删除临时文件
-        os.remove(temp_gif)
+        """
+        保存动画为视频文件。
+        用共享的渲染引擎逐帧通过管道交给ffmpeg，一次编码直接得到目标文件；
+        先写到同目录下唯一的临时文件再原子替换，同时导出多个视频也不会互相覆盖。
+        """
+        directory = os.path.dirname(os.path.abspath(output_path))
+        suffix = os.path.splitext(output_path)[1]
+        fd, temp_path = tempfile.mkstemp(suffix=suffix, dir=directory)
+        os.close(fd)
+        try:
+            with TextAnimation() as animator:
+                # 与animate()相同的按顶点数显示方式
+                animator.apply_settings({
+                    'text': self.text,
+                    'font_name': self.font_name,
+                    'font_size': self.font_size,
+                    'line_color': self.line_color,
+                    'line_width': self.line_width,
+                    'fps': self.fps,
+                    'duration': self.duration,
+                    'reveal_mode': 'vertices',
+                })
+                animator.save_animation(temp_path)
+            os.replace(temp_path, output_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
         
         return output_path
     
@@ -156,8 +152,9 @@ class AnimationApp:
         
         # 字体选择
         ttk.Label(control_frame, text="选择字体:").grid(row=1, column=0, sticky=tk.W, pady=5)
-        self.font_var = tk.StringVar(value="Arial")
-        font_list = list(font.families())
+        # 字体列表来自字体索引，与渲染时实际能找到的字体一致
+        self.font_var = tk.StringVar(value=font_index.default_family())
+        font_list = font_index.families()
         font_combo = ttk.Combobox(control_frame, textvariable=self.font_var, values=font_list, width=18)
         font_combo.grid(row=1, column=1, pady=5)
         
@@ -211,24 +208,10 @@ class AnimationApp:
         font_name = self.font_var.get()
         font_size = self.size_var.get()
         
-        # 创建文本路径
-        font_prop = FontProperties(family=font_name, size=font_size)
-        text_path = TextPath((0, 0), text, prop=font_prop)
-        
-        # 获取文本边界以便居中
-        text_bounds = text_path.get_extents()
-        width = text_bounds.width
-        height = text_bounds.height
-        
-        # 创建变换以居中文本
-        transform = Affine2D().translate(5 - width/2, 3 - height/2)
-        text_path = transform.transform_path(text_path)
-        
         # 绘制文本轮廓
-        for path in text_path.to_polygons():
-            if len(path) > 2:
-                x, y = path[:, 0], path[:, 1]
-                self.preview_ax.plot(x, y, color='white', lw=2)
+        for path in text_polygons(text, font_name, font_size):
+            x, y = path[:, 0], path[:, 1]
+            self.preview_ax.plot(x, y, color='white', lw=2)
         
         self.canvas.draw()
     
@@ -0,0 +1,171 @@
+"""
+批量渲染。
+
+    python batch.py specs.jsonl --output-dir out/ --workers 4
+
+specs.jsonl每行一个渲染参数，例如 {"text": "Hello", "font": "DejaVu Sans", "size": 72, "duration": 3}，
+可选字段有backend，以及只在命令行中使用的output（把结果复制为该文件名）。
+每完成一项就输出一行JSON结果，最后一行是汇总（含每分钟完成的视频数）。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from collections import deque
+
+from text_animation import DEFAULT_FPS, BACKENDS
+from ffmpeg_pipe import EncoderSettings
+from font_index import font_index
+from render_cache import normalize_params
+from render_jobs import JobQueue, DONE
+from admission import SIZE_RANGE, DURATION_RANGE
+
+# 一次批量请求最多的条目数
+MAX_BATCH_ITEMS = 500
+
+
+def spec_params(spec, encoder, incremental=True, fps=DEFAULT_FPS):
+    """把一条渲染参数规范化为任务参数，参数不合法时抛出ValueError"""
+    if not isinstance(spec, dict):
+        raise ValueError("每一项必须是JSON对象")
+    text = str(spec.get('text', 'Hello'))
+    font_name = str(spec.get('font', font_index.default_family()))
+    if font_name not in font_index:
+        raise ValueError(f"未知字体: {font_name}")
+    backend = spec.get('backend', 'matplotlib')
+    if backend not in BACKENDS:
+        raise ValueError(f"不支持的渲染后端: {backend}")
+    try:
+        font_size = int(spec.get('size', 72))
+        duration = float(spec.get('duration', 5.0))
+    except (TypeError, ValueError):
+        raise ValueError("size和duration必须是数字")
+    if not SIZE_RANGE[0] <= font_size <= SIZE_RANGE[1]:
+        raise ValueError(f"size应在{SIZE_RANGE[0]}到{SIZE_RANGE[1]}之间")
+    if not DURATION_RANGE[0] <= duration <= DURATION_RANGE[1]:
+        raise ValueError(f"duration应在{DURATION_RANGE[0]}到{DURATION_RANGE[1]}之间")
+    return normalize_params(text, font_name, font_size, duration, fps,
+                            encoder.to_dict(), backend, incremental)
+
+
+def group_key(params):
+    """字体、字号和渲染设置相同的条目排在一起提交，共享渲染进程中已缓存的字形和图形"""
+    return (params['font'], params['size'], params['backend'], params['fps'],
+            params['incremental'], json.dumps(params['encoder'], sort_keys=True))
+
+
+def run_batch(job_queue, specs, encoder, incremental=True, submit=None, poll=0.5):
+    """
+    提交一批渲染参数，按完成顺序产出每一项的结果，最后产出汇总。
+    结果中的index是该项在输入中的位置；参数不合法的项直接返回invalid。
+    submit(params)返回(任务ID, 重试秒数)，任务ID为None表示预算不足，稍后再提交该项；
+    抛出ValueError时该项为invalid。web端传入经过准入控制的提交函数，每一项按估计成本计费，
+    批量任务因此与单个请求共用渲染预算；默认直接提交，不做限制。
+    """
+    if submit is None:
+        submit = lambda params: (job_queue.submit(params), 0)
+    start = time.monotonic()
+    items = []
+    counts = {'done': 0, 'failed': 0, 'invalid': 0}
+    for index, spec in enumerate(specs):
+        try:
+            items.append((index, spec_params(spec, encoder, incremental)))
+        except ValueError as e:
+            counts['invalid'] += 1
+            yield {'index': index, 'status': 'invalid', 'error': str(e)}
+
+    # 分组后按顺序提交；相同参数的项共用一个任务
+    items.sort(key=lambda item: group_key(item[1]))
+    pending = deque(items)
+    indexes = {}
+    while pending or indexes:
+        # 按顺序提交，预算不足时停下，等已提交的项完成后再继续
+        while pending:
+            index, params = pending[0]
+            try:
+                job_id, _ = submit(params)
+            except ValueError as e:
+                pending.popleft()
+                counts['invalid'] += 1
+                yield {'index': index, 'status': 'invalid', 'error': str(e)}
+                continue
+            if job_id is None:
+                break
+            pending.popleft()
+            indexes.setdefault(job_id, []).append(index)
+
+        if not indexes:
+            # 预算被其他请求占满，本批次没有进行中的项
+            time.sleep(poll)
+            continue
+        for job_id, state in job_queue.as_completed(list(indexes), poll):
+            for index in indexes.pop(job_id):
+                result = {'index': index, 'job_id': job_id, 'status': state['status']}
+                if state['status'] == DONE:
+                    result['filename'] = state['filename']
+                    counts['done'] += 1
+                else:
+                    result['error'] = state.get('error', '')
+                    counts['failed'] += 1
+                yield result
+            if pending:
+                break  # 每完成一项就尝试提交等待中的项
+
+    elapsed = time.monotonic() - start
+    yield {
+        'summary': True,
+        'items': len(specs),
+        'done': counts['done'],
+        'failed': counts['failed'],
+        'invalid': counts['invalid'],
+        'seconds': round(elapsed, 3),
+        'clips_per_minute': round(counts['done'] / elapsed * 60, 2) if elapsed else None,
+    }
+
+
+def load_specs(lines):
+    """读取JSONL，跳过空行"""
+    return [json.loads(line) for line in lines if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='批量渲染文字动画')
+    parser.add_argument('specs', help='JSONL文件，"-"表示标准输入')
+    parser.add_argument('--output-dir', default='batch_output', help='视频输出目录')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='渲染进程数')
+    parser.add_argument('--no-incremental', action='store_true', help='关闭增量渲染')
+    args = parser.parse_args(argv)
+
+    if args.specs == '-':
+        specs = load_specs(sys.stdin)
+    else:
+        with open(args.specs, encoding='utf-8') as f:
+            specs = load_specs(f)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    jobs_folder = tempfile.mkdtemp(prefix='text_animation_batch_')
+    job_queue = JobQueue(args.output_dir, jobs_folder, max_workers=args.workers)
+    failed = 0
+    try:
+        for result in run_batch(job_queue, specs, EncoderSettings(),
+                                incremental=not args.no_incremental):
+            spec = specs[result['index']] if 'index' in result else None
+            output = spec.get('output') if isinstance(spec, dict) else None
+            if output and result.get('filename'):
+                target = os.path.join(args.output_dir, output)
+                shutil.copyfile(os.path.join(args.output_dir, result['filename']), target)
+                result['output'] = target
+            if result.get('summary'):
+                failed = result['failed'] + result['invalid']
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+    finally:
+        job_queue.shutdown()
+        shutil.rmtree(jobs_folder, ignore_errors=True)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
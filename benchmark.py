@@ -0,0 +1,317 @@
+"""
+渲染流程各阶段的基准测试。
+
+    python benchmark.py                          # 完整扫描，结果写到 benchmark_results.json
+    python benchmark.py --quick                  # 只跑少量用例
+    python benchmark.py --save-baseline          # 把本次结果保存为基线
+    python benchmark.py --baseline benchmark_baseline.json --threshold 1.2
+    python benchmark.py --check                  # 只检查渲染结果的一致性
+
+每个用例在单独的进程中运行，峰值内存（ru_maxrss）互不影响。
+与基线比较时，任一阶段耗时超过基线的threshold倍即视为变慢，退出码为1。
+--check 比较numpy与matplotlib后端、增量绘制与整帧重绘的输出，并确认笔画按弧长匀速显示，不通过时退出码为1。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# 默认用例，其余用例每次只改变其中一个参数
+DEFAULT_CASE = {'text': 'Hello', 'size': 72, 'duration': 5.0, 'fps': 30, 'backend': 'matplotlib'}
+
+# 各参数的扫描范围；字号与网页允许的10-200一致
+SWEEPS = {
+    'text': ['Hi', 'Hello World', 'The quick brown fox jumps over the lazy dog'],
+    'size': [10, 72, 200],
+    'duration': [2.0, 5.0, 10.0],
+    'fps': [24, 30, 60],
+    'backend': ['matplotlib', 'numpy'],
+}
+QUICK_SWEEPS = {
+    'text': ['Hi', 'Hello World'],
+    'size': [10, 72],
+    'backend': ['matplotlib', 'numpy'],
+}
+
+# 参与基线比较的耗时指标
+TIMED_STAGES = ('text_to_paths', 'preview', 'render_frames', 'save_animation')
+# 差值小于此值（秒）的阶段不算变慢，避免毫秒级阶段的计时抖动
+MIN_DELTA = 0.005
+
+# 一致性检查的用例：字号较小时整段文字都在画面内
+CHECK_CASES = [dict(DEFAULT_CASE, size=10, duration=2.0), dict(DEFAULT_CASE, size=40, duration=2.0)]
+# 每个用例比较的帧数，在第0帧到笔画画完之间均匀选取
+CHECK_FRAMES = 5
+# numpy后端增量绘制与整帧重绘之间允许的逐像素差（灰度级）
+MAX_INCREMENTAL_DIFF = 1
+# 已显示弧长与进度的相对误差上限
+ARC_LENGTH_TOLERANCE = 1e-6
+
+DEFAULT_OUTPUT = 'benchmark_results.json'
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+
+
+def build_cases(sweeps):
+    """沿每个维度扫描，去掉重复的用例"""
+    cases = []
+    for name, values in sweeps.items():
+        for value in values:
+            case = dict(DEFAULT_CASE, **{name: value})
+            if case not in cases:
+                cases.append(case)
+    return cases
+
+
+def case_id(case):
+    return (f"text={len(case['text'])}ch size={case['size']} duration={case['duration']:g}s "
+            f"fps={case['fps']} backend={case['backend']}")
+
+
+def _peak_rss():
+    """当前进程的峰值常驻内存（字节）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _new_animator(case):
+    from text_animation import TextAnimation
+    animator = TextAnimation()
+    animator.fps = case['fps']
+    animator.set_text(case['text'])
+    animator.set_font('DejaVu Sans', case['size'])
+    animator.set_duration(case['duration'])
+    animator.set_backend(case['backend'])
+    return animator
+
+
+def run_case(case, incremental=True):
+    """在子进程中执行一个用例，返回各阶段的测量结果"""
+    result = {'case': case, 'id': case_id(case)}
+
+    # text_to_paths：首次调用（字形缓存为空）和缓存命中后的耗时
+    with _new_animator(case) as animator:
+        animator.set_incremental(incremental)
+        start = time.perf_counter()
+        animator.text_to_paths()
+        result['text_to_paths_cold'] = time.perf_counter() - start
+        start = time.perf_counter()
+        animator.text_to_paths()
+        result['text_to_paths'] = time.perf_counter() - start
+        # 字形缓存：首次调用全部未命中，第二次全部命中
+        from glyph_cache import glyph_cache
+        stats = glyph_cache.stats()
+        result['glyph_cache_hits'] = stats['hits']
+        result['glyph_cache_misses'] = stats['misses']
+        result['glyph_cache_entries'] = stats['entries']
+        result['paths'] = len(animator.paths)
+        result['vertices'] = int(sum(len(path) for path in animator.paths))
+        result['vertices_in'] = int(animator.counters['vertices_in'])
+
+    with _new_animator(case) as animator:
+        start = time.perf_counter()
+        animator.generate_preview_image()
+        result['preview'] = time.perf_counter() - start
+
+    # 只渲染不编码：逐帧绘制的耗时
+    with _new_animator(case) as animator:
+        animator.set_incremental(incremental)
+        animator.text_to_paths()
+        rendered = min(animator.schedule.complete_frame + 1, animator.frames)
+        _, _, _, render_frame = animator._frame_renderer()
+        start = time.perf_counter()
+        for i in range(rendered):
+            render_frame(i)
+        elapsed = time.perf_counter() - start
+        result['render_frames'] = elapsed
+        result['rendered_frames'] = rendered
+        result['frames'] = animator.frames
+        result['render_fps'] = rendered / elapsed if elapsed else None
+
+    # 端到端：渲染并编码成视频
+    output_path = os.path.join(tempfile.mkdtemp(), 'benchmark.mp4')
+    try:
+        with _new_animator(case) as animator:
+            animator.set_incremental(incremental)
+            start = time.perf_counter()
+            animator.save_animation(output_path)
+            elapsed = time.perf_counter() - start
+        result['save_animation'] = elapsed
+        result['save_fps'] = result['frames'] / elapsed if elapsed else None
+        result['output_bytes'] = os.path.getsize(output_path)
+    finally:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        os.rmdir(os.path.dirname(output_path))
+
+    result['peak_rss'] = _peak_rss()
+    return result
+
+
+def run_suite(cases, incremental=True):
+    results = []
+    ctx = multiprocessing.get_context('spawn')
+    for case in cases:
+        # 每个用例一个新进程，峰值内存和缓存状态互不影响
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+            result = executor.submit(run_case, case, incremental).result()
+        print(format_result(result), flush=True)
+        results.append(result)
+    return results
+
+
+def format_result(result):
+    return (f"{result['id']:<62} paths {result['text_to_paths'] * 1000:7.2f}ms  "
+            f"preview {result['preview'] * 1000:7.1f}ms  "
+            f"render {result['render_fps']:7.1f}fps  save {result['save_animation']:6.2f}s  "
+            f"rss {result['peak_rss'] / 2 ** 20:6.1f}MB  out {result['output_bytes'] / 1024:7.1f}KB")
+
+
+def _render_frames(case, incremental, indexes):
+    """按顺序渲染到indexes中的最后一帧，返回这些帧的RGB副本"""
+    from text_animation import _rgb
+    with _new_animator(case) as animator:
+        animator.set_incremental(incremental)
+        animator.text_to_paths()
+        _, _, _, render_frame = animator._frame_renderer()
+        frames = {}
+        for i in range(indexes[-1] + 1):
+            frame = render_frame(i)
+            if i in indexes:
+                frames[i] = np.array(_rgb(frame))
+        return frames
+
+
+def _arc_length(polyline):
+    return float(np.hypot(*np.diff(polyline, axis=0).T).sum()) if len(polyline) > 1 else 0.0
+
+
+def check_case(case):
+    """检查一个用例，返回不通过的项目描述列表"""
+    from raster import MAX_MEAN_ERROR, mean_frame_error
+    failures = []
+    with _new_animator(case) as animator:
+        animator.text_to_paths()
+        schedule = animator.schedule
+    last = min(schedule.complete_frame, schedule.frames - 1)
+    indexes = sorted(set(np.linspace(0, last, CHECK_FRAMES).astype(int).tolist()))
+
+    # numpy后端与matplotlib后端：平均误差在MAX_MEAN_ERROR以内
+    numpy_case = dict(case, backend='numpy')
+    reference = _render_frames(dict(case, backend='matplotlib'), False, indexes)
+    full = _render_frames(numpy_case, False, indexes)
+    for i in indexes:
+        error = mean_frame_error(reference[i], full[i])
+        if not error < MAX_MEAN_ERROR:
+            failures.append(f"numpy后端第{i}帧平均误差 {error:.3f} 超过 {MAX_MEAN_ERROR:g}")
+
+    # 增量绘制与整帧重绘：numpy后端逐像素最多差MAX_INCREMENTAL_DIFF，matplotlib后端平均误差在MAX_MEAN_ERROR以内
+    incremental = _render_frames(numpy_case, True, indexes)
+    for i in indexes:
+        diff = int(np.abs(full[i].astype(np.int16) - incremental[i]).max())
+        if diff > MAX_INCREMENTAL_DIFF:
+            failures.append(f"numpy后端增量绘制第{i}帧最大差 {diff} 超过 {MAX_INCREMENTAL_DIFF}")
+    incremental = _render_frames(dict(case, backend='matplotlib'), True, indexes)
+    for i in indexes:
+        error = mean_frame_error(reference[i], incremental[i])
+        if not error < MAX_MEAN_ERROR:
+            failures.append(f"matplotlib后端增量绘制第{i}帧平均误差 {error:.3f} 超过 {MAX_MEAN_ERROR:g}")
+
+    # 弧长进度：每帧每条路径已显示的长度等于进度乘以路径全长
+    totals = [_arc_length(path) for path in schedule.paths]
+    for i in range(schedule.frames):
+        for j, total in enumerate(totals):
+            shown = _arc_length(schedule.visible(i, j))
+            expected = schedule.path_progress[i, j] * total
+            if abs(shown - expected) > ARC_LENGTH_TOLERANCE * max(total, 1):
+                failures.append(f"第{i}帧第{j}条路径显示长度 {shown:.6f}，按进度应为 {expected:.6f}")
+    return failures
+
+
+def run_checks(cases):
+    """逐个用例检查，返回全部不通过的项目"""
+    failures = []
+    for case in cases:
+        problems = check_case(case)
+        print(f"{case_id(case):<62} {'通过' if not problems else f'{len(problems)}项不通过'}", flush=True)
+        failures += [f"{case_id(case)}: {problem}" for problem in problems]
+    return failures
+
+
+def compare(results, baseline, threshold):
+    """与基线逐项比较，返回变慢的(用例, 阶段, 基线耗时, 当前耗时)列表"""
+    previous = {r['id']: r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get(result['id'])
+        if old is None:
+            continue
+        for stage in TIMED_STAGES:
+            if stage not in old or result[stage] - old[stage] < MIN_DELTA:
+                continue
+            if result[stage] > old[stage] * threshold:
+                regressions.append((result['id'], stage, old[stage], result[stage]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='渲染流程基准测试')
+    parser.add_argument('--quick', action='store_true', help='只跑少量用例')
+    parser.add_argument('--no-incremental', action='store_true', help='关闭增量渲染')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='结果JSON文件')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基线JSON文件')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='耗时超过基线的倍数时视为变慢（默认1.2）')
+    parser.add_argument('--check', action='store_true', help='只检查渲染结果的一致性')
+    args = parser.parse_args(argv)
+
+    if args.check:
+        failures = run_checks(CHECK_CASES)
+        for failure in failures:
+            print(f"不通过: {failure}")
+        return 1 if failures else 0
+
+    cases = build_cases(QUICK_SWEEPS if args.quick else SWEEPS)
+    results = run_suite(cases, incremental=not args.no_incremental)
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'incremental': not args.no_incremental,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"结果已保存到 {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"基线已保存到 {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"没有基线文件 {args.baseline}，跳过比较")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for case, stage, old, new in regressions:
+        print(f"变慢: {case} {stage} {old:.4f}s -> {new:.4f}s ({new / old:.2f}x)")
+    if not regressions:
+        print(f"与基线相比没有超过 {args.threshold:g} 倍的变慢")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
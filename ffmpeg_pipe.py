@@ -0,0 +1,194 @@
+import os
+import subprocess
+import tempfile
+
+import numpy as np
+import matplotlib
+
+
+class EncoderSettings:
+    """视频编码参数，替代原来写死的bitrate=1800"""
+
+    def __init__(self, codec='libx264', crf=23, preset='veryfast', pix_fmt='yuv420p',
+                 extra_args=(), fragment_seconds=None):
+        self.codec = codec
+        self.crf = crf
+        self.preset = preset
+        self.pix_fmt = pix_fmt
+        self.extra_args = tuple(extra_args)
+        # 设置后输出分片MP4，每隔这么多秒一个关键帧和一个分片，文件写出一部分就可以边下边播
+        self.fragment_seconds = fragment_seconds
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**(values or {}))
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        """从环境变量VIDEO_CODEC、VIDEO_CRF、VIDEO_PRESET、VIDEO_PIX_FMT读取，各前端得到相同的缓存键"""
+        return cls(
+            codec=environ.get('VIDEO_CODEC', 'libx264'),
+            crf=int(environ.get('VIDEO_CRF', 23)),
+            preset=environ.get('VIDEO_PRESET', 'veryfast'),
+            pix_fmt=environ.get('VIDEO_PIX_FMT', 'yuv420p'),
+        )
+
+    def to_dict(self):
+        """用于缓存键和跨进程传递"""
+        return {
+            'codec': self.codec,
+            'crf': self.crf,
+            'preset': self.preset,
+            'pix_fmt': self.pix_fmt,
+            'extra_args': list(self.extra_args),
+            'fragment_seconds': self.fragment_seconds,
+        }
+
+    def to_args(self):
+        """转换为ffmpeg输出端参数"""
+        args = ['-c:v', self.codec]
+        if self.crf is not None:
+            args += ['-crf', str(self.crf)]
+        if self.preset:
+            args += ['-preset', self.preset]
+        if self.pix_fmt:
+            args += ['-pix_fmt', self.pix_fmt]
+        if self.fragment_seconds:
+            # moov放在开头且不含样本表，之后每个关键帧开始一个moof+mdat分片；
+            # 每个数据包立即写出，读取方能尽早拿到完整的分片
+            args += ['-force_key_frames', f'expr:gte(t,n_forced*{self.fragment_seconds})',
+                     '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+                     '-flush_packets', '1']
+        return args + list(self.extra_args)
+
+
+# 支持的输入像素格式及其通道数
+PIX_FMT_CHANNELS = {'rgba': 4, 'rgb24': 3, 'gray': 1}
+
+
+def ffmpeg_path():
+    """与matplotlib的FFMpegWriter使用同一个ffmpeg可执行文件"""
+    return matplotlib.rcParams['animation.ffmpeg_path']
+
+
+class FFmpegPipeWriter:
+    """
+    通过stdin把原始帧直接写给常驻的ffmpeg进程。
+    帧可以是Agg画布的buffer_rgba()，也可以是形状为(高, 宽)、(高, 宽, 3)或(高, 宽, 4)的uint8数组；
+    像素格式直接交给ffmpeg处理，Python侧不做转换和拷贝。
+    """
+
+    def __init__(self, output_path, width, height, fps, encoder=None, input_pix_fmt='rgba',
+                 hold_frames=0):
+        self.output_path = output_path
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.encoder = encoder or EncoderSettings()
+        self.input_pix_fmt = input_pix_fmt
+        self.channels = PIX_FMT_CHANNELS[input_pix_fmt]
+        self.frame_bytes = width * height * self.channels
+        # 最后一帧在编码端重复的次数，用于静止的结尾
+        self.hold_frames = hold_frames
+        self.frames_written = 0
+        self._proc = None
+
+    def command(self):
+        """构造ffmpeg命令行"""
+        return [
+            ffmpeg_path(), '-y', '-loglevel', 'error', '-nostats',
+            '-f', 'rawvideo', '-pix_fmt', self.input_pix_fmt,
+            '-s', f'{self.width}x{self.height}', '-r', str(self.fps),
+            '-i', '-',
+            *(['-vf', f'tpad=stop_mode=clone:stop={self.hold_frames}'] if self.hold_frames else []),
+            *self.encoder.to_args(),
+            self.output_path,
+        ]
+
+    def open(self):
+        self._proc = subprocess.Popen(self.command(), stdin=subprocess.PIPE,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        return self
+
+    def write(self, frame):
+        """写入一帧"""
+        if isinstance(frame, np.ndarray):
+            shape = (self.height, self.width, self.channels)[:3 if self.channels > 1 else 2]
+            if frame.dtype != np.uint8 or frame.shape != shape:
+                raise ValueError(
+                    f"帧格式应为uint8 {shape}，"
+                    f"实际为{frame.dtype} {frame.shape}")
+            # 非连续数组（如切片视图）才需要拷贝
+            frame = np.ascontiguousarray(frame).data
+        elif memoryview(frame).nbytes != self.frame_bytes:
+            raise ValueError(f"帧大小应为{self.frame_bytes}字节")
+        try:
+            self._proc.stdin.write(frame)
+        except BrokenPipeError:
+            self._fail()
+        self.frames_written += 1
+
+    def close(self):
+        """结束输入并等待ffmpeg完成编码"""
+        if self._proc is None:
+            return
+        proc, self._proc = self._proc, None
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        stderr = proc.stderr.read()
+        proc.stderr.close()
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg编码失败: {stderr.decode('utf-8', 'replace').strip()}")
+
+    def abort(self):
+        """出错时终止ffmpeg进程"""
+        if self._proc is None:
+            return
+        proc, self._proc = self._proc, None
+        proc.kill()
+        proc.wait()
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        proc.stderr.close()
+
+    def _fail(self):
+        proc, self._proc = self._proc, None
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        stderr = proc.stderr.read()
+        proc.wait()
+        proc.stderr.close()
+        raise RuntimeError(f"ffmpeg编码失败: {stderr.decode('utf-8', 'replace').strip()}")
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def concat_segments(segment_paths, output_path):
+    """用ffmpeg的concat demuxer无损拼接编码参数相同的视频分段"""
+    fd, list_path = tempfile.mkstemp(suffix='.txt', dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            for path in segment_paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        result = subprocess.run(
+            [ffmpeg_path(), '-y', '-loglevel', 'error', '-nostats',
+             '-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', output_path],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg拼接失败: {result.stderr.decode('utf-8', 'replace').strip()}")
+    finally:
+        os.remove(list_path)
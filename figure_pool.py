@@ -0,0 +1,73 @@
+import threading
+from contextlib import contextmanager
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# 画布尺寸（英寸）和坐标范围
+FIGSIZE = (10, 6)
+XLIM = (0, 10)
+YLIM = (0, 6)
+
+
+def configure_axes(ax):
+    """黑色背景、固定坐标范围、隐藏坐标轴"""
+    ax.set_facecolor('black')
+    ax.set_xlim(*XLIM)
+    ax.set_ylim(*YLIM)
+    ax.axis('off')
+
+
+def new_figure(figsize=FIGSIZE):
+    """
+    用面向对象的Figure接口创建Agg画布。
+    不经过pyplot，图形不会进入pyplot的全局注册表。
+    """
+    fig = Figure(figsize=figsize, facecolor='black')
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    configure_axes(ax)
+    return fig, ax
+
+
+class FigurePool:
+    """进程内的预配置图形池，借出时是干净的画布，归还时清空后复用"""
+
+    def __init__(self, maxsize=4, figsize=FIGSIZE):
+        self.maxsize = maxsize
+        self.figsize = figsize
+        self.created = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """借出一个(fig, ax)"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self.created += 1
+        return new_figure(self.figsize)
+
+    def release(self, fig, ax):
+        """清空后归还；池满时直接丢弃，交给垃圾回收"""
+        ax.clear()
+        configure_axes(ax)
+        with self._lock:
+            if len(self._idle) < self.maxsize:
+                self._idle.append((fig, ax))
+
+    @contextmanager
+    def figure(self):
+        fig, ax = self.acquire()
+        try:
+            yield fig, ax
+        finally:
+            self.release(fig, ax)
+
+    def stats(self):
+        with self._lock:
+            return {'idle': len(self._idle), 'created': self.created, 'maxsize': self.maxsize}
+
+
+# 每个进程（gunicorn worker或渲染进程）一个图形池
+figure_pool = FigurePool()
@@ -0,0 +1,122 @@
+import os
+import json
+import threading
+
+import matplotlib
+from matplotlib.font_manager import fontManager, findfont, weight_dict, FontProperties
+
+# 索引格式版本，格式变化时递增
+INDEX_VERSION = 1
+
+# 通用字体族名，按matplotlib的rcParams解析到具体字体
+GENERIC_FAMILIES = ('sans-serif', 'serif', 'monospace', 'cursive', 'fantasy')
+
+# 已安装时优先作为默认字体
+PREFERRED_DEFAULT = 'Arial'
+
+
+def default_index_path():
+    """索引文件放在matplotlib的缓存目录中，与它自己的字体列表缓存放在一起"""
+    return os.path.join(matplotlib.get_cachedir(), f'text_animation_fonts-v{INDEX_VERSION}.json')
+
+
+def _weight(entry):
+    weight = entry.weight
+    return weight if isinstance(weight, int) else weight_dict.get(weight, 400)
+
+
+class FontIndex:
+    """
+    字体族名到字体文件的索引。
+    启动时构建一次并保存到磁盘，之后按名字直接查表，不再经过findfont的逐个打分搜索；
+    未知字体可以在渲染前直接拒绝，而不是静默回退到默认字体。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_index_path()
+        self._fonts = None  # 小写名字 -> (显示名, 字体文件)
+        self._lock = threading.Lock()
+
+    def _fingerprint(self):
+        # matplotlib重建字体列表（升级或安装新字体后）时字体数量或版本会变化
+        return {'version': INDEX_VERSION, 'matplotlib': matplotlib.__version__,
+                'fonts': len(fontManager.ttflist)}
+
+    def _build(self):
+        """每个字体族取最接近常规样式（normal、400、normal宽度）的文件"""
+        best = {}
+        for entry in fontManager.ttflist:
+            score = (entry.style != 'normal', abs(_weight(entry) - 400),
+                     entry.stretch != 'normal', entry.fname)
+            current = best.get(entry.name)
+            if current is None or score < current[0]:
+                best[entry.name] = (score, entry.fname)
+        fonts = {name.lower(): (name, fname) for name, (_, fname) in best.items()}
+        for family in GENERIC_FAMILIES:
+            try:
+                fname = findfont(FontProperties(family=[family]), fallback_to_default=False)
+            except ValueError:
+                continue  # 没有安装属于这个通用族的字体
+            fonts.setdefault(family, (family, fname))
+        return fonts
+
+    def _load_file(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('fingerprint') != self._fingerprint():
+            return None
+        return {key: tuple(value) for key, value in data['fonts'].items()}
+
+    def _save_file(self, fonts):
+        temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'fingerprint': self._fingerprint(), 'fonts': fonts}, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except OSError:
+            pass  # 缓存目录不可写时只保留内存中的索引
+
+    def load(self):
+        """读取磁盘上的索引，过期或不存在时重建并保存；可重复调用"""
+        with self._lock:
+            if self._fonts is None:
+                fonts = self._load_file()
+                if fonts is None:
+                    fonts = self._build()
+                    self._save_file(fonts)
+                self._fonts = fonts
+            return self._fonts
+
+    def resolve(self, name):
+        """字体名对应的字体文件，未知字体返回None"""
+        entry = self.load().get(name.strip().lower())
+        return entry[1] if entry else None
+
+    def canonical(self, name):
+        """索引中的字体族名（大小写与安装的字体一致），未知字体原样返回去掉首尾空白的名字"""
+        entry = self.load().get(name.strip().lower())
+        return entry[0] if entry else name.strip()
+
+    def __contains__(self, name):
+        return self.resolve(name) is not None
+
+    def families(self):
+        """已安装的字体族名（不含通用族名），按名字排序"""
+        return sorted(name for key, (name, _) in self.load().items() if key not in GENERIC_FAMILIES)
+
+    def default_family(self):
+        """PREFERRED_DEFAULT已安装时用它，否则用sans-serif对应的字体族"""
+        if PREFERRED_DEFAULT in self:
+            return PREFERRED_DEFAULT
+        fname = self.resolve('sans-serif')
+        for name, path in self.load().values():
+            if path == fname and name not in GENERIC_FAMILIES:
+                return name
+        return 'sans-serif'
+
+
+# 进程内共享的字体索引
+font_index = FontIndex()
@@ -0,0 +1,145 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from matplotlib.path import Path
+from matplotlib.textpath import TextPath, text_to_path
+from matplotlib.font_manager import FontProperties
+
+from font_index import font_index
+
+
+class _CachedGlyphs:
+    """
+    传给matplotlib排版函数的glyph_map。
+    只用于判断字形是否已缓存，已缓存的字形不会再被提取轮廓。
+    """
+
+    def __init__(self, cache, font_file, size):
+        self.cache = cache
+        self.font_file = font_file
+        self.size = size
+
+    def __contains__(self, glyph_repr):
+        return (self.font_file, self.size, glyph_repr) in self.cache._entries
+
+
+class GlyphCache:
+    """按(字体文件, 字号, 字形)缓存细分后的字形多边形的LRU缓存"""
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _tessellate(self, verts, codes, size):
+        """把FONT_SCALE下的字形轮廓缩放到目标字号并细分为多边形"""
+        scale = size / text_to_path.FONT_SCALE
+        path = Path(np.asarray(verts) * scale, codes)
+        # 与TextPath一致，不做路径简化
+        path.should_simplify = False
+        polygons = path.to_polygons()
+        extents = path.get_extents() if len(path.vertices) else None
+        return polygons, extents
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return entry
+
+    def _put(self, key, entry):
+        self.misses += 1
+        self._entries[key] = entry
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def layout(self, text, font_prop):
+        """
+        把文本排版为字形多边形，返回(多边形列表, 边界)。
+        坐标与TextPath((0, 0), text, prop=font_prop)一致。
+        """
+        size = font_prop.get_size_in_points()
+        scale = size / text_to_path.FONT_SCALE
+        with self._lock:
+            font = text_to_path._get_font(font_prop)
+            font_file = font.fname
+            glyph_info, new_glyphs, _ = text_to_path.get_glyphs_with_font(
+                font, text, glyph_map=_CachedGlyphs(self, font_file, size),
+                return_new_glyphs_only=True)
+
+            # 先取出已缓存的字形，避免插入新字形时把本次要用的条目淘汰掉
+            entries = [self._get((font_file, size, info[0])) for info in glyph_info]
+            for i, (glyph_repr, _, _, _) in enumerate(glyph_info):
+                if entries[i] is None:
+                    key = (font_file, size, glyph_repr)
+                    entries[i] = self._entries.get(key)
+                    if entries[i] is None:
+                        verts, codes = new_glyphs[glyph_repr]
+                        entries[i] = self._tessellate(verts, codes, size)
+                        self._put(key, entries[i])
+
+        polygons = []
+        x0 = y0 = np.inf
+        x1 = y1 = -np.inf
+        for (_, xposition, yposition, _), (glyph_polygons, extents) in zip(glyph_info, entries):
+            if extents is None:
+                continue
+            offset = np.array([xposition * scale, yposition * scale])
+            polygons.extend(polygon + offset for polygon in glyph_polygons)
+            x0 = min(x0, extents.x0 + offset[0])
+            y0 = min(y0, extents.y0 + offset[1])
+            x1 = max(x1, extents.x1 + offset[0])
+            y1 = max(y1, extents.y1 + offset[1])
+        return polygons, (x0, y0, x1, y1)
+
+    def stats(self):
+        """返回命中/未命中次数和当前条目数"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'maxsize': self.maxsize,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# 进程内共享的字形缓存
+glyph_cache = GlyphCache()
+
+
+def text_polygons(text, font_name, font_size, center=(5, 3)):
+    """
+    将文本转换为以center为参考点居中的多边形列表（只保留至少3个点的多边形）。
+    与直接对整段文本构造TextPath再调用to_polygons()的结果一致。
+    """
+    # 索引中有的字体直接按文件加载，不经过findfont的搜索
+    font_file = font_index.resolve(font_name)
+    if font_file is not None:
+        font_prop = FontProperties(fname=font_file, size=font_size)
+    else:
+        font_prop = FontProperties(family=font_name, size=font_size)
+    if '$' in text:
+        # 可能触发mathtext排版，走原来的整段路径
+        text_path = TextPath((0, 0), text, prop=font_prop)
+        bounds = text_path.get_extents()
+        polygons = text_path.to_polygons()
+        width, height = bounds.width, bounds.height
+    else:
+        polygons, (x0, y0, x1, y1) = glyph_cache.layout(text, font_prop)
+        if not polygons:
+            return []
+        width, height = x1 - x0, y1 - y0
+
+    # 创建平移以居中文本
+    offset = np.array([center[0] - width / 2, center[1] - height / 2])
+    return [polygon + offset for polygon in polygons if len(polygon) > 2]
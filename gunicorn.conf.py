@@ -0,0 +1,33 @@
+# gunicorn配置，gunicorn启动时自动读取当前目录下的这个文件
+import os
+import time
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# 线程worker：/batch和/stream的响应在渲染结束前一直保持打开，只占用一个线程；
+# 心跳由worker主线程发送，耗时长的响应不会因timeout被杀掉
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+
+# 在master中导入应用并预热，worker fork后通过写时复制共享已加载的模块、字体索引和字形
+preload_app = True
+
+
+def on_starting(server):
+    from warmup import warm_up
+    timings = warm_up()
+    server.log.info("预热完成: " + ", ".join(f"{name} {seconds * 1000:.0f}ms"
+                                            for name, seconds in timings.items()))
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.monotonic()
+
+
+def post_worker_init(worker):
+    # fork之后到可以处理请求所用的时间
+    from app import worker_stats, metrics
+    worker_stats['boot_seconds'] = time.monotonic() - worker.forked_at
+    metrics.flush()
+    worker.log.info(f"worker {worker.pid} 启动耗时 {worker_stats['boot_seconds'] * 1000:.1f}ms")
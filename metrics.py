@@ -0,0 +1,306 @@
+import os
+import copy
+import json
+import math
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows下没有fcntl，只统计本进程
+    fcntl = None
+
+from render_jobs import pid_alive
+
+# 耗时直方图的默认分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, math.inf)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 共享目录中的文件：每个进程一个快照，已退出进程的计数合并到归档中
+SNAPSHOT_PREFIX = 'metrics_'
+ARCHIVE_NAME = 'archive.json'
+LOCK_NAME = '.lock'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(str(value))}"' for name, value in labels)
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class _Metric:
+    """按标签值分组保存数据；记录时只做一次加锁的字典更新，格式化留到抓取时"""
+
+    kind = None
+    # 是否写入进程快照，由抓取的进程汇总所有进程的数据
+    shared = True
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        # 数据变化后的回调，由Registry设置，用于写出进程快照
+        self._changed = None
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def _notify(self):
+        if self._changed is not None:
+            self._changed()
+
+    def snapshot(self):
+        """可写成JSON的[[标签值列表, 数据], ...]"""
+        with self._lock:
+            return [[list(key), copy.deepcopy(value)] for key, value in self._values.items()]
+
+    def merge(self, values, snapshot):
+        """把一个快照累加到values（标签值元组 -> 数据）中"""
+        raise NotImplementedError
+
+    def _samples(self, values):
+        raise NotImplementedError
+
+    def expose(self, values=None):
+        """values为汇总后的数据，默认只输出本进程的数据"""
+        if values is None:
+            values = {}
+            if self.shared:
+                self.merge(values, self.snapshot())
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for suffix, labels, value in self._samples(values):
+            lines.append(f'{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._notify()
+
+    def merge(self, values, snapshot):
+        for key, value in snapshot:
+            key = tuple(key)
+            values[key] = values.get(key, 0) + value
+
+    def _samples(self, values):
+        for key, value in sorted(values.items()):
+            yield '_total', list(zip(self.labelnames, key)), value
+
+
+class Gauge(_Metric):
+    """
+    取值在抓取时由回调计算，不需要在业务代码里维护。
+    per_process为False时回调本身给出全局的值（如来自共享文件），只在抓取的进程中计算；
+    为True时每个进程的取值写入快照，按pid标签分别输出仍在运行的进程。
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, callback, per_process=False):
+        super().__init__(name, documentation, ('pid',) if per_process else ())
+        self.callback = callback
+        self.shared = per_process
+
+    def snapshot(self):
+        return [[[str(os.getpid())], self.callback()]]
+
+    def merge(self, values, snapshot):
+        for key, value in snapshot:
+            values[tuple(key)] = value
+
+    def _samples(self, values):
+        if not self.shared:
+            yield '', [], self.callback()
+            return
+        for key, value in sorted(values.items()):
+            yield '', list(zip(self.labelnames, key)), value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        if self.buckets[-1] != math.inf:
+            self.buckets += (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for k, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[0][k] += 1
+                    break
+            data[1] += value
+            data[2] += 1
+        self._notify()
+
+    def merge(self, values, snapshot):
+        for key, (counts, total, count) in snapshot:
+            key = tuple(key)
+            data = values.get(key)
+            if data is None:
+                values[key] = [list(counts), total, count]
+                continue
+            data[0] = [a + b for a, b in zip(data[0], counts)]
+            data[1] += total
+            data[2] += count
+
+    def _samples(self, values):
+        for key, (counts, total, count) in sorted(values.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                yield '_bucket', labels + [('le', _format_value(bound))], cumulative
+            yield '_sum', labels, total
+            yield '_count', labels, count
+
+
+class Registry:
+    """
+    按Prometheus文本格式输出所有指标。
+    指定shared_dir时，每个进程在数据变化时把自己的快照写到这个目录，抓取时汇总所有进程：
+    计数器和直方图按进程相加（已退出进程的数据合并到归档中，不会因进程退出而减少），
+    按进程的仪表只输出仍在运行的进程。同一台机器上的多个web worker因此输出同一组序列。
+    """
+
+    def __init__(self, shared_dir=None):
+        self._metrics = []
+        self.shared_dir = shared_dir if fcntl is not None else None
+        self._lock = threading.Lock()
+        self._pid = None
+        if self.shared_dir:
+            os.makedirs(self.shared_dir, exist_ok=True)
+
+    def register(self, metric):
+        metric._changed = self.flush
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, callback, per_process=False):
+        return self.register(Gauge(name, documentation, callback, per_process))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def _snapshot_path(self, pid):
+        return os.path.join(self.shared_dir, f"{SNAPSHOT_PREFIX}{pid}.json")
+
+    @contextmanager
+    def _locked(self):
+        with open(os.path.join(self.shared_dir, LOCK_NAME), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def flush(self):
+        """把本进程的快照写到共享目录；未指定shared_dir时什么也不做"""
+        if self.shared_dir is None:
+            return
+        with self._lock:
+            pid = os.getpid()
+            path = self._snapshot_path(pid)
+            if self._pid != pid:
+                # 本进程第一次写快照：同pid的旧文件来自已退出的进程，先归档
+                with self._locked():
+                    self._archive([path])
+                self._pid = pid
+            data = {metric.name: metric.snapshot() for metric in self._metrics if metric.shared}
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(temp_path, path)
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _archive(self, paths):
+        """在加锁状态下把已退出进程的计数器和直方图合并到归档文件，并删除它们的快照"""
+        snapshots = [(path, self._read(path)) for path in paths]
+        snapshots = [(path, data) for path, data in snapshots if data is not None]
+        if not snapshots:
+            return
+        archive_path = os.path.join(self.shared_dir, ARCHIVE_NAME)
+        archive = self._read(archive_path) or {}
+        for metric in self._metrics:
+            if not metric.shared or isinstance(metric, Gauge):
+                continue
+            values = {}
+            metric.merge(values, archive.get(metric.name, []))
+            for _, data in snapshots:
+                metric.merge(values, data.get(metric.name, []))
+            archive[metric.name] = [[list(key), value] for key, value in values.items()]
+        temp_path = f"{archive_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(archive, f)
+        os.replace(temp_path, archive_path)
+        for path, _ in snapshots:
+            os.remove(path)
+
+    def _collect(self):
+        """汇总所有进程的数据：{指标名: {标签值元组: 数据}}"""
+        self.flush()
+        with self._locked():
+            live, dead = [], []
+            for name in os.listdir(self.shared_dir):
+                if not (name.startswith(SNAPSHOT_PREFIX) and name.endswith('.json')):
+                    continue
+                pid = name[len(SNAPSHOT_PREFIX):-len('.json')]
+                path = os.path.join(self.shared_dir, name)
+                if pid.isdigit() and pid_alive(int(pid)):
+                    live.append(path)
+                else:
+                    dead.append(path)
+            self._archive(dead)
+            archive = self._read(os.path.join(self.shared_dir, ARCHIVE_NAME)) or {}
+            snapshots = [data for data in map(self._read, live) if data is not None]
+        merged = {}
+        for metric in self._metrics:
+            values = merged[metric.name] = {}
+            if not isinstance(metric, Gauge):
+                metric.merge(values, archive.get(metric.name, []))
+            for data in snapshots:
+                metric.merge(values, data.get(metric.name, []))
+        return merged
+
+    def expose(self):
+        merged = self._collect() if self.shared_dir else {}
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.expose(merged.get(metric.name)))
+        return '\n'.join(lines) + '\n'
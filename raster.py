@@ -0,0 +1,176 @@
+import numpy as np
+from matplotlib.colors import to_rgb
+
+# 与matplotlib后端逐帧比较时允许的平均绝对误差（0-255灰度级）
+MAX_MEAN_ERROR = 2.0
+
+# 长线段切分后每段的最大像素长度，使包围盒面积与线段长度成正比
+MAX_PIECE_LENGTH = 8.0
+
+
+class LineRasterizer:
+    """
+    纯NumPy的抗锯齿折线光栅化器。
+    把数据坐标中的折线画到uint8帧缓冲区上，用于替代matplotlib的逐帧绘制。
+    覆盖率按像素中心到线段的距离计算，线段端点和拐角为圆形。
+    """
+
+    def __init__(self, width, height, axes_box, xlim, ylim, line_width, color='white'):
+        # axes_box为坐标轴在画布中的像素范围(x0, y0, x1, y1)，y轴向上
+        self.width = width
+        self.height = height
+        self.axes_box = axes_box
+        self.half_width = line_width / 2
+        rgb = np.array(to_rgb(color))
+        self.grayscale = bool(np.all(rgb == rgb[0]))
+        self.white = bool(np.all(rgb == 1))
+        # 覆盖率(0-255)到输出像素值的查找表
+        self._lut = np.rint(np.arange(256)[:, None] * rgb).astype(np.uint8)
+        x0, y0, x1, y1 = axes_box
+        self._scale = np.array([(x1 - x0) / (xlim[1] - xlim[0]), (y1 - y0) / (ylim[1] - ylim[0])])
+        self._offset = np.array([x0 - xlim[0] * self._scale[0], y0 - ylim[0] * self._scale[1]])
+        # 像素行列的裁剪范围（坐标轴以外的像素不绘制，与matplotlib的clip一致）
+        self._clip = (int(np.floor(x0)), int(np.floor(height - y1)),
+                      int(np.ceil(x1)), int(np.ceil(height - y0)))
+        # 以0-255表示的覆盖率缓冲区
+        self.coverage = np.zeros((height, width), dtype=np.uint8)
+
+    @classmethod
+    def from_axes(cls, ax, line_width, color='white'):
+        """从matplotlib坐标轴读取画布尺寸和坐标变换"""
+        fig = ax.figure
+        width, height = (fig.get_size_inches() * fig.dpi).round().astype(int)
+        box = ax.get_position()
+        axes_box = (box.x0 * width, box.y0 * height, box.x1 * width, box.y1 * height)
+        return cls(width, height, axes_box, ax.get_xlim(), ax.get_ylim(),
+                   line_width * fig.dpi / 72, color)
+
+    def to_pixels(self, points):
+        """数据坐标转换为像素坐标（x向右，y向下，像素中心在+0.5处）"""
+        pixels = points * self._scale + self._offset
+        pixels[:, 1] = self.height - pixels[:, 1]
+        return pixels
+
+    def clear(self):
+        self.coverage.fill(0)
+
+    def draw_segments(self, starts, ends):
+        """
+        把一批线段画到覆盖率缓冲区上。
+        starts, ends为(N, 2)像素坐标数组；全部线段一次性向量化处理。
+        """
+        if len(starts) == 0:
+            return
+        pad = self.half_width + 1
+        cx0, cy0, cx1, cy1 = self._clip
+        starts, ends = self._clip_segments(starts, ends, (cx0 - pad, cy0 - pad, cx1 + pad, cy1 + pad))
+        starts, ends = self._split_segments(starts, ends)
+        if len(starts) == 0:
+            return
+
+        lo = np.floor(np.minimum(starts, ends) - pad).astype(np.int64)
+        hi = np.ceil(np.maximum(starts, ends) + pad).astype(np.int64)
+        lo[:, 0] = np.clip(lo[:, 0], cx0, cx1)
+        lo[:, 1] = np.clip(lo[:, 1], cy0, cy1)
+        hi[:, 0] = np.clip(hi[:, 0], cx0, cx1)
+        hi[:, 1] = np.clip(hi[:, 1], cy0, cy1)
+        nx = hi[:, 0] - lo[:, 0]
+        ny = hi[:, 1] - lo[:, 1]
+        counts = np.where((nx > 0) & (ny > 0), nx * ny, 0)
+        total = int(counts.sum())
+        if total == 0:
+            return
+
+        # 只保留与裁剪区域相交的线段
+        keep = counts > 0
+        starts, ends, lo, nx, counts = starts[keep], ends[keep], lo[keep], nx[keep], counts[keep]
+
+        # 为每个线段的包围盒展开像素坐标
+        seg = np.repeat(np.arange(len(starts), dtype=np.int32), counts)
+        first = np.cumsum(counts) - counts
+        local = np.arange(total, dtype=np.int32) - first[seg].astype(np.int32)
+        row_width = nx[seg].astype(np.int32)
+        px = lo[seg, 0].astype(np.int32) + local % row_width
+        py = lo[seg, 1].astype(np.int32) + local // row_width
+
+        # 像素中心到线段的距离（单精度足够表示像素级精度）
+        a = starts.astype(np.float32)[seg]
+        d = ends.astype(np.float32)[seg] - a
+        qx = px + np.float32(0.5) - a[:, 0]
+        qy = py + np.float32(0.5) - a[:, 1]
+        length2 = d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1]
+        t = np.clip((qx * d[:, 0] + qy * d[:, 1]) / np.where(length2 > 0, length2, 1), 0, 1)
+        dx = qx - t * d[:, 0]
+        dy = qy - t * d[:, 1]
+        distance = np.sqrt(dx * dx + dy * dy)
+        cover = (np.clip(self.half_width + 0.5 - distance, 0, 1) * 255 + 0.5).astype(np.uint8)
+
+        hit = cover > 0
+        np.maximum.at(self.coverage, (py[hit], px[hit]), cover[hit])
+
+    @staticmethod
+    def _clip_segments(starts, ends, box):
+        """Liang-Barsky算法把线段裁剪到矩形内，丢弃完全在外面的线段"""
+        x0, y0, x1, y1 = box
+        d = ends - starts
+        t0 = np.zeros(len(starts))
+        t1 = np.ones(len(starts))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for p, q in ((-d[:, 0], starts[:, 0] - x0), (d[:, 0], x1 - starts[:, 0]),
+                         (-d[:, 1], starts[:, 1] - y0), (d[:, 1], y1 - starts[:, 1])):
+                r = q / p
+                t0 = np.where(p < 0, np.maximum(t0, r), t0)
+                t1 = np.where(p > 0, np.minimum(t1, r), t1)
+                # 与边平行且在外侧
+                t1 = np.where((p == 0) & (q < 0), -1, t1)
+        keep = t0 <= t1
+        d = d[keep]
+        return starts[keep] + t0[keep, None] * d, starts[keep] + t1[keep, None] * d
+
+    @staticmethod
+    def _split_segments(starts, ends):
+        """把长线段切成不超过MAX_PIECE_LENGTH的小段"""
+        d = ends - starts
+        pieces = np.maximum(np.ceil(np.hypot(d[:, 0], d[:, 1]) / MAX_PIECE_LENGTH), 1).astype(np.int64)
+        if np.all(pieces == 1):
+            return starts, ends
+        seg = np.repeat(np.arange(len(starts)), pieces)
+        k = np.arange(len(seg)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+        step = d[seg] / pieces[seg, None]
+        piece_starts = starts[seg] + k[:, None] * step
+        return piece_starts, piece_starts + step
+
+    def draw_polylines(self, polylines):
+        """画若干条像素坐标折线"""
+        starts = [p[:-1] for p in polylines if len(p) > 1]
+        if not starts:
+            return
+        ends = [p[1:] for p in polylines if len(p) > 1]
+        self.draw_segments(np.concatenate(starts), np.concatenate(ends))
+
+    def frame(self):
+        """
+        返回当前帧：灰度线条时为(高, 宽)图像，否则为(高, 宽, 3)的RGB图像。
+        白色线条直接返回内部缓冲区，调用方需在下一次绘制前用完。
+        """
+        if self.white:
+            return self.coverage
+        if self.grayscale:
+            return self._lut[:, 0][self.coverage]
+        return self._lut[self.coverage]
+
+    @property
+    def pix_fmt(self):
+        """frame()输出对应的ffmpeg像素格式"""
+        return 'gray' if self.grayscale else 'rgb24'
+
+
+def mean_frame_error(a, b):
+    """两帧之间的平均绝对误差，用于与matplotlib后端对照"""
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    if a.ndim == 3 and b.ndim == 2:
+        a = a[:, :, :3].mean(axis=2)
+    if b.ndim == 3 and a.ndim == 2:
+        b = b[:, :, :3].mean(axis=2)
+    return float(np.abs(a - b).mean())
@@ -0,0 +1,233 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import threading
+import unicodedata
+
+from font_index import font_index
+
+try:
+    import fcntl
+except ImportError:  # Windows下没有fcntl，只做进程内合并
+    fcntl = None
+
+# 渲染器版本号，渲染逻辑变化时递增，使旧缓存自然失效
+RENDER_VERSION = 4
+
+
+def normalize_params(text, font_name, font_size, duration, fps, encoder=None,
+                     backend='matplotlib', incremental=False):
+    """
+    规范化渲染参数，保证等价请求得到相同的键。
+    字体名换成字体索引中的族名，只有大小写或首尾空白不同的字体名得到相同的键。
+    encoder为EncoderSettings.to_dict()的结果；编码参数、渲染后端或增量模式不同视为不同的视频。
+    """
+    return {
+        'version': RENDER_VERSION,
+        'text': unicodedata.normalize('NFC', text),
+        'font': font_index.canonical(font_name),
+        'size': int(font_size),
+        'duration': round(float(duration), 3),
+        'fps': int(fps),
+        'encoder': encoder or {},
+        'backend': backend,
+        'incremental': bool(incremental),
+    }
+
+
+def normalize_preview_params(text, font_name, font_size, image_format, duration=None,
+                             frames=None):
+    """规范化预览参数，用于计算预览图的ETag；关键帧拼图还取决于动画时长和帧数"""
+    params = {
+        'version': RENDER_VERSION,
+        'preview': image_format,
+        'text': unicodedata.normalize('NFC', text),
+        'font': font_index.canonical(font_name),
+        'size': int(font_size),
+    }
+    if frames is not None:
+        params['duration'] = round(float(duration), 3)
+        params['frames'] = int(frames)
+    return params
+
+
+def cache_key(params):
+    """根据规范化参数计算内容哈希"""
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """按参数哈希缓存渲染结果，并合并并发的相同请求"""
+
+    def __init__(self, folder, prefix='animation_', suffix='.mp4'):
+        self.folder = folder
+        self.prefix = prefix
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._pattern = re.compile(re.escape(prefix) + r'([0-9a-f]{64})' + re.escape(suffix))
+        # 渲染临时文件（<输出文件名>.<pid>.<tid>.tmp<后缀>）和由它派生的分段目录
+        self._leftover_pattern = re.compile(
+            re.escape(prefix) + r'([0-9a-f]{64})' + re.escape(suffix) + r'\..*\.tmp.*')
+        os.makedirs(self.folder, exist_ok=True)
+
+    def filename(self, key):
+        """缓存键对应的文件名"""
+        return f"{self.prefix}{key}{self.suffix}"
+
+    def path(self, key):
+        """缓存键对应的完整路径"""
+        return os.path.join(self.folder, self.filename(key))
+
+    def lookup(self, key):
+        """命中时返回文件名并记录访问时间，否则返回None"""
+        if self.touch(key):
+            return self.filename(key)
+        return None
+
+    def touch(self, key):
+        """
+        把访问时间记录为文件的atime（保留mtime，不影响ETag/Last-Modified），
+        供StorageManager按最近使用顺序淘汰。文件不存在时返回False。
+        """
+        path = self.path(key)
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def key_of(self, filename):
+        """缓存输出文件名对应的键；锁文件、临时文件等其他文件返回None"""
+        match = self._pattern.fullmatch(filename)
+        return match.group(1) if match else None
+
+    def leftover_key(self, filename):
+        """渲染临时文件或分段目录对应的键，其他文件返回None"""
+        match = self._leftover_pattern.fullmatch(filename)
+        return match.group(1) if match else None
+
+    def remove_leftover(self, filename):
+        """
+        删除渲染进程异常退出后留下的临时文件或分段目录。
+        持有该键的跨进程文件锁时才删除，仍在渲染时跳过并返回False。
+        """
+        key = self.leftover_key(filename)
+        if key is None:
+            return False
+        lock_file = None
+        if fcntl is not None:
+            lock_file = open(self.path(key) + '.lock', 'w')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return False
+        try:
+            path = os.path.join(self.folder, filename)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            if lock_file is not None and not os.path.exists(self.path(key)):
+                # 这个键没有渲染结果，锁文件也不再需要
+                os.remove(self.path(key) + '.lock')
+            return not os.path.lexists(path)
+        finally:
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+    def evict(self, key):
+        """
+        删除缓存的视频。持有跨进程文件锁时才删除，正在渲染同一个键时跳过。
+        返回释放的字节数。
+        """
+        final_path = self.path(key)
+        lock_file = None
+        if fcntl is not None:
+            lock_file = open(final_path + '.lock', 'w')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return 0
+        try:
+            try:
+                size = os.stat(final_path).st_size
+                os.remove(final_path)
+            except FileNotFoundError:
+                size = 0
+            if lock_file is not None:
+                os.remove(final_path + '.lock')
+            return size
+        finally:
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+    def get_or_render(self, params, render):
+        """
+        返回(文件名, 是否命中缓存)。
+        render(output_path)负责把视频写到给定路径；
+        同一进程内相同键的并发请求只会触发一次渲染，其余请求等待结果。
+        """
+        key = cache_key(params)
+        filename = self.lookup(key)
+        if filename:
+            return filename, True
+
+        with self._lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = threading.Event()
+                self._inflight[key] = event
+
+        if not leader:
+            # 等待正在进行的渲染完成
+            event.wait()
+            filename = self.lookup(key)
+            if filename:
+                return filename, True
+            # 领头请求失败，由当前请求自己重试
+            return self.get_or_render(params, render)
+
+        try:
+            return self._render_locked(key, render)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+
+    def _render_locked(self, key, render):
+        """持有跨进程文件锁进行渲染，先写临时文件再原子替换"""
+        final_path = self.path(key)
+        lock_file = None
+        if fcntl is not None:
+            lock_file = open(final_path + '.lock', 'w')
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            # 其他worker进程可能已经在我们等锁期间完成了渲染
+            if os.path.exists(final_path):
+                return self.filename(key), True
+
+            temp_path = f"{final_path}.{os.getpid()}.{threading.get_ident()}.tmp{self.suffix}"
+            try:
+                render(temp_path)
+                os.replace(temp_path, final_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            return self.filename(key), False
+        finally:
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
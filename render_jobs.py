@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from render_cache import RenderCache, cache_key
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# 进度写盘的最小间隔（秒），避免每帧都写文件
+PROGRESS_INTERVAL = 0.5
+# 渲染中的任务超过这么久（秒）没有更新进度，视为渲染进程已退出
+STALE_RUNNING_SECONDS = 600
+
+
+def _write_state(jobs_folder, job_id, **state):
+    """原子地写入任务状态文件，多个web worker都能读到"""
+    state['job_id'] = job_id
+    state['updated'] = time.time()
+    path = os.path.join(jobs_folder, f"{job_id}.json")
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(temp_path, path)
+
+
+def read_state(jobs_folder, job_id):
+    """读取任务状态，不存在时返回None"""
+    path = os.path.join(jobs_folder, f"{job_id}.json")
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def pid_alive(pid):
+    """进程是否仍在运行"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _init_render_worker():
+    """渲染进程启动时预热一次，之后的任务共享已加载的字体索引、字形和图形池"""
+    from warmup import warm_up
+    warm_up()
+
+
+def _run_job(job_id, params, upload_folder, jobs_folder, chunk_workers=1, owner=None):
+    """在渲染进程中执行的任务；owner为提交任务的web进程"""
+    # 在子进程中导入，web进程不需要为此加载matplotlib
+    from text_animation import TextAnimation
+    from ffmpeg_pipe import EncoderSettings
+
+    frames_total = int(params['duration'] * params['fps'])
+    last_write = [0.0]
+    stats = {}
+    # 渲染中状态的附加字段：提交任务的web进程，以及分片MP4正在写入的临时文件名（供/stream边写边读）
+    running = {'owner': owner}
+
+    def on_progress(done, total):
+        now = time.monotonic()
+        if done < total and now - last_write[0] < PROGRESS_INTERVAL:
+            return
+        last_write[0] = now
+        _write_state(jobs_folder, job_id, status=RUNNING,
+                     frames_done=done, frames_total=total, **running)
+
+    def render(output_path):
+        encoder = EncoderSettings.from_dict(params['encoder'])
+        workers = chunk_workers
+        if encoder.fragment_seconds:
+            # 分段并行渲染要等所有分段完成才拼接，边写边读时只能按顺序编码
+            workers = 1
+            running['partial'] = os.path.basename(output_path)
+            _write_state(jobs_folder, job_id, status=RUNNING,
+                         frames_done=0, frames_total=frames_total, **running)
+        animator = TextAnimation()
+        animator.fps = params['fps']
+        animator.set_text(params['text'])
+        animator.set_font(params['font'], params['size'])
+        animator.set_duration(params['duration'])
+        animator.set_backend(params['backend'])
+        animator.set_incremental(params['incremental'])
+        animator.save_animation(output_path, progress_callback=on_progress,
+                                encoder=encoder, workers=workers)
+        stats['timings'] = animator.timings
+        stats['counters'] = animator.counters
+
+    _write_state(jobs_folder, job_id, status=RUNNING,
+                 frames_done=0, frames_total=frames_total, **running)
+    start = time.monotonic()
+    try:
+        filename, hit = RenderCache(upload_folder).get_or_render(params, render)
+    except Exception as e:
+        _write_state(jobs_folder, job_id, status=FAILED, error=str(e),
+                     frames_done=0, frames_total=frames_total)
+        raise
+    _write_state(jobs_folder, job_id, status=DONE, filename=filename,
+                 frames_done=frames_total, frames_total=frames_total)
+    # 返回给web进程用于监控；结果来自其他进程的渲染时没有分阶段耗时
+    return {'filename': filename, 'cached': hit, 'seconds': time.monotonic() - start,
+            'timings': stats.get('timings', {}), 'counters': stats.get('counters', {})}
+
+
+class JobQueue:
+    """把视频渲染交给有并发上限的进程池，请求线程立即返回任务ID"""
+
+    def __init__(self, upload_folder, jobs_folder, max_workers=2, chunk_workers=1,
+                 on_complete=None):
+        self.upload_folder = upload_folder
+        self.jobs_folder = jobs_folder
+        self.max_workers = max_workers
+        # 每个任务内部并行渲染的进程数
+        self.chunk_workers = chunk_workers
+        self.cache = RenderCache(upload_folder)
+        # on_complete(job_id, result, error)：任务结束时在web进程中调用，
+        # result为_run_job的返回值（失败时为None），用于记录监控指标
+        self.on_complete = on_complete
+        self._lock = threading.Lock()
+        self._executor = None
+        self._futures = {}
+        os.makedirs(self.jobs_folder, exist_ok=True)
+
+    def _get_executor(self):
+        # 延迟创建进程池，避免在gunicorn master中启动子进程
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_render_worker)
+        return self._executor
+
+    def submit(self, params):
+        """提交渲染任务，返回任务ID；任务ID即参数的缓存键"""
+        job_id = cache_key(params)
+        frames_total = int(params['duration'] * params['fps'])
+        filename = self.cache.lookup(job_id)
+        if filename:
+            _write_state(self.jobs_folder, job_id, status=DONE, filename=filename,
+                         frames_done=frames_total, frames_total=frames_total)
+            return job_id
+
+        with self._lock:
+            future = self._futures.get(job_id)
+            if future is not None and not future.done():
+                # 相同参数的任务已在排队或渲染中
+                return job_id
+            _write_state(self.jobs_folder, job_id, status=QUEUED,
+                         frames_done=0, frames_total=frames_total, owner=os.getpid())
+            args = (_run_job, job_id, params, self.upload_folder, self.jobs_folder,
+                    self.chunk_workers, os.getpid())
+            try:
+                future = self._get_executor().submit(*args)
+            except BrokenProcessPool:
+                # 渲染进程异常退出后进程池不可再用，重建一个
+                self._executor = None
+                future = self._get_executor().submit(*args)
+            future.add_done_callback(lambda f: self._on_done(job_id, f))
+            self._futures[job_id] = future
+        return job_id
+
+    def _on_done(self, job_id, future):
+        with self._lock:
+            if self._futures.get(job_id) is future:
+                del self._futures[job_id]
+        error = future.exception()
+        if self.on_complete is not None:
+            self.on_complete(job_id, None if error is not None else future.result(), error)
+        if error is not None:
+            # 进程崩溃等情况下子进程来不及写状态，这里补上
+            state = read_state(self.jobs_folder, job_id) or {}
+            if state.get('status') != FAILED:
+                _write_state(self.jobs_folder, job_id, status=FAILED, error=str(error),
+                             frames_done=state.get('frames_done', 0),
+                             frames_total=state.get('frames_total', 0))
+
+    def status(self, job_id):
+        """返回任务状态字典，未知任务返回None"""
+        state = read_state(self.jobs_folder, job_id)
+        if state is not None and state['status'] == DONE and not self.cache.touch(job_id):
+            # 视频已被StorageManager淘汰，视为未知任务，重新提交会重新渲染
+            return None
+        if state is not None and state['status'] in (QUEUED, RUNNING) and self._stale(job_id, state):
+            # 提交任务的web进程已退出（它的渲染进程随之退出），或渲染进程长时间没有进度，
+            # 状态不会再更新；报告为失败，重新提交会重新渲染
+            state = dict(state, status=FAILED, error='渲染进程已退出')
+        if state is None:
+            # 状态文件被清理但结果仍在缓存中
+            filename = self.cache.lookup(job_id)
+            if filename:
+                state = {'job_id': job_id, 'status': DONE, 'filename': filename,
+                         'frames_done': 0, 'frames_total': 0}
+        return state
+
+    def _stale(self, job_id, state):
+        """排队或渲染中的状态是否已不会再更新；本进程中仍在进行的任务总是有效"""
+        with self._lock:
+            if job_id in self._futures:
+                return False
+        owner = state.get('owner')
+        if owner is not None and not pid_alive(owner):
+            return True
+        return state['status'] == RUNNING and time.time() - state['updated'] > STALE_RUNNING_SECONDS
+
+    def as_completed(self, job_ids, poll=0.5):
+        """
+        按完成顺序产出(job_id, 状态)，重复的任务ID只产出一次。
+        本进程提交的任务等待其future，其他进程提交的任务轮询状态文件。
+        """
+        pending = list(dict.fromkeys(job_ids))
+        while pending:
+            waiting = []
+            for job_id in pending:
+                state = self.status(job_id)
+                if state is None:
+                    # 状态文件和结果都不存在（例如视频刚被淘汰），不再等待
+                    yield job_id, {'job_id': job_id, 'status': FAILED, 'error': '任务不存在'}
+                elif state['status'] in (DONE, FAILED):
+                    yield job_id, state
+                else:
+                    waiting.append(job_id)
+            pending = waiting
+            if pending:
+                with self._lock:
+                    futures = [self._futures[j] for j in pending if j in self._futures]
+                if futures:
+                    wait(futures, timeout=poll, return_when=FIRST_COMPLETED)
+                else:
+                    time.sleep(poll)
+
+    def in_flight(self):
+        """当前进程提交且尚未完成的任务数"""
+        with self._lock:
+            return len(self._futures)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,135 @@
+import numpy as np
+
+# 笔画显示方式
+REVEAL_MODES = ('arclength', 'vertices')
+
+# 第j条路径比第0条晚开始的进度
+PATH_DELAY = 0.05
+# 整体进度的加速系数，使所有路径在动画结束前画完
+PROGRESS_SPEED = 1.5
+
+
+class RevealSchedule:
+    """
+    预先计算所有帧、所有路径的显示进度表。
+    arclength模式按弧长匀速显示，末端插值到线段中间；
+    vertices模式按顶点数显示，与最初的逐帧计算方式一致。
+    """
+
+    def __init__(self, paths, frames, mode='arclength', rows=None):
+        """rows为递增的帧序号时只计算这些帧，进度表的第k行对应第rows[k]帧；默认计算全部帧"""
+        if mode not in REVEAL_MODES:
+            raise ValueError(f"不支持的显示方式: {mode}")
+        self.paths = paths
+        self.frames = frames
+        self.mode = mode
+        sizes = np.array([len(path) for path in paths], dtype=np.int64)
+
+        # (帧数, 路径数)的进度表
+        rows = np.arange(frames) if rows is None else np.asarray(rows, dtype=np.int64)
+        progress = rows / frames if frames else np.zeros(0)
+        delays = np.arange(len(paths)) * PATH_DELAY
+        self.path_progress = np.clip(progress[:, None] * PROGRESS_SPEED - delays[None, :], 0, 1)
+
+        if mode == 'vertices' or not len(paths):
+            self.counts = (self.path_progress * sizes).astype(np.int64)
+            self.fractions = None
+            return
+
+        # 所有路径的归一化累计弧长拼在一起，第j条路径的键落在[j, j+1]
+        starts = np.cumsum(sizes) - sizes
+        vertices = np.concatenate(paths)
+        steps = np.concatenate([[0.0], np.hypot(*np.diff(vertices, axis=0).T)])
+        steps[starts] = 0
+        lengths = np.cumsum(steps)
+        lengths -= np.repeat(lengths[starts], sizes)
+        totals = lengths[starts + sizes - 1]
+        keys = (np.repeat(np.arange(len(paths)), sizes)
+                + lengths / np.repeat(np.where(totals > 0, totals, 1), sizes))
+
+        # 一次searchsorted得到每帧每条路径已完整显示的顶点数
+        targets = np.arange(len(paths))[None, :] + self.path_progress
+        index = np.searchsorted(keys, targets.ravel(), side='right').reshape(targets.shape)
+        counts = np.clip(index - starts[None, :], 0, sizes[None, :])
+        counts[self.path_progress <= 0] = 0
+        self.counts = counts
+
+        # 末端落在第count-1和第count个顶点之间，记录按弧长插值的比例
+        partial = (counts > 0) & (counts < sizes[None, :])
+        g = np.where(partial, starts[None, :] + counts - 1, 0)
+        span = keys[np.minimum(g + 1, len(keys) - 1)] - keys[g]
+        fractions = (targets - keys[g]) / np.where(span > 0, span, 1)
+        fractions[span <= 0] = 0
+        fractions[~partial] = np.nan
+        self.fractions = fractions
+
+    @property
+    def complete_frame(self):
+        """所有笔画都已画完的第一帧；之后的帧与它完全相同。动画结束时仍未画完则返回帧数"""
+        return complete_frame(len(self.paths), self.frames)
+
+    def visible(self, i, j, paths=None):
+        """第i帧第j条路径可见的折线；paths可传入同一组路径的其他坐标（如像素坐标）"""
+        path = (self.paths if paths is None else paths)[j]
+        n = self.counts[i, j]
+        if self.fractions is None or np.isnan(self.fractions[i, j]):
+            return path[:n]
+        return np.concatenate([path[:n], self._tip(i, path, j)])
+
+    def new_ink(self, i, j, previous, paths=None):
+        """
+        从第previous帧到第i帧新显示的折线段（previous为-1表示尚未绘制）。
+        从上次的末端开始，保证与已绘制部分首尾相连。
+        """
+        if previous < 0 or self.counts[previous, j] == 0:
+            return self.visible(i, j, paths)
+        path = (self.paths if paths is None else paths)[j]
+        start = self.counts[previous, j]
+        pieces = []
+        if self.fractions is not None and not np.isnan(self.fractions[previous, j]):
+            pieces.append(self._tip(previous, path, j))
+        else:
+            start -= 1
+        pieces.append(path[start:self.counts[i, j]])
+        if self.fractions is not None and not np.isnan(self.fractions[i, j]):
+            pieces.append(self._tip(i, path, j))
+        return np.concatenate(pieces)
+
+    def changed(self, i, previous):
+        """第previous帧到第i帧之间有新内容的路径序号"""
+        if previous < 0:
+            return np.flatnonzero(self.counts[i] > 0)
+        moved = self.path_progress[i] > self.path_progress[previous]
+        return np.flatnonzero(moved & (self.counts[i] > 0))
+
+    def _tip(self, i, path, j):
+        """第i帧第j条路径在线段中间的末端点"""
+        n = self.counts[i, j]
+        return path[n - 1:n] + self.fractions[i, j] * (path[n:n + 1] - path[n - 1:n])
+
+
+def complete_frame(count, frames):
+    """
+    count条路径全部画完的第一帧，不必计算进度表：最后一条路径的进度最晚到达1。
+    在估计值附近按与进度表相同的浮点运算确认，结果与逐帧计算一致。
+    """
+    if not count or not frames:
+        return 0
+    last_delay = np.arange(count)[-1] * PATH_DELAY
+    guess = int(np.ceil((1 + last_delay) * frames / PROGRESS_SPEED))
+    candidates = np.arange(max(guess - 2, 0), min(guess + 3, frames))
+    done = candidates / frames * PROGRESS_SPEED - last_delay >= 1
+    if not done.any():
+        return frames
+    return int(candidates[np.argmax(done)])
+
+
+def path_timing(count, duration):
+    """
+    每条路径开始描绘的时间和描绘持续时间（秒），与RevealSchedule的进度公式一致：
+    第j条路径在 j*PATH_DELAY/PROGRESS_SPEED 处开始，用 1/PROGRESS_SPEED 的时长画完。
+    arclength模式下描绘速度恒定，因此可以直接交给浏览器做线性插值。
+    """
+    delays = np.arange(count) * PATH_DELAY * duration / PROGRESS_SPEED
+    durations = np.full(count, duration / PROGRESS_SPEED)
+    return delays, durations
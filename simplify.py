@@ -0,0 +1,89 @@
+import numpy as np
+
+# 默认允许的简化误差（像素）：远小于线宽，肉眼看不出差别
+DEFAULT_TOLERANCE_PX = 0.25
+
+
+def douglas_peucker(points, tolerance):
+    """
+    Douglas-Peucker折线简化：保留首尾点，递归保留离当前线段最远且超过tolerance的点。
+    首尾相同的闭合多边形同样适用（退化线段按到点的距离计算）。
+    """
+    n = len(points)
+    if n < 3:
+        return points
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+        a = points[i]
+        d = points[j] - a
+        q = points[i + 1:j] - a
+        length2 = d @ d
+        if length2 > 0:
+            t = np.clip(q @ d / length2, 0, 1)
+            q = q - t[:, None] * d
+        distance = np.hypot(q[:, 0], q[:, 1])
+        k = int(np.argmax(distance))
+        if distance[k] > tolerance:
+            m = i + 1 + k
+            keep[m] = True
+            stack.append((i, m))
+            stack.append((m, j))
+    return points[keep]
+
+
+def simplify_paths(paths, tolerance):
+    """
+    简化所有路径，返回(新路径列表, 简化前顶点数, 简化后顶点数)。
+    简化后不足以构成多边形（少于4个点，即闭合三角形）的路径保持原样，避免细小笔画消失。
+    """
+    simplified = []
+    before = after = 0
+    for path in paths:
+        result = douglas_peucker(path, tolerance)
+        if len(result) < 4:
+            result = path
+        simplified.append(result)
+        before += len(path)
+        after += len(result)
+    return simplified, before, after
+
+
+def data_tolerance(ax, tolerance_px):
+    """把像素误差换算成坐标轴的数据单位（取x、y两个方向中较精细的一个）"""
+    origin, unit = ax.transData.transform([[0, 0], [1, 1]])
+    return tolerance_px / np.max(np.abs(unit - origin))
+
+
+def view_bounds(ax, margin_px):
+    """坐标轴的可见范围(x0, y0, x1, y1)（数据单位），各边向外扩展margin_px像素"""
+    origin, unit = ax.transData.transform([[0, 0], [1, 1]])
+    margin = margin_px / np.min(np.abs(unit - origin))
+    (x0, x1), (y0, y1) = sorted(ax.get_xlim()), sorted(ax.get_ylim())
+    return x0 - margin, y0 - margin, x1 + margin, y1 + margin
+
+
+def offscreen(path, bounds):
+    """路径的包围盒是否完全在bounds以外；此时其中任意两点之间的线段也都在范围以外"""
+    x0, y0, x1, y1 = bounds
+    (px0, py0), (px1, py1) = path.min(axis=0), path.max(axis=0)
+    return px1 < x0 or px0 > x1 or py1 < y0 or py0 > y1
+
+
+def cull_paths(paths, bounds):
+    """
+    把完全在可见范围以外的路径替换为只有一个点的路径，返回(新路径列表, 替换的路径数)。
+    这些路径画出来什么也看不到，单个点也不构成线段；保留路径本身而不是删除，其余路径的序号和显示延迟不变。
+    """
+    culled = []
+    count = 0
+    for path in paths:
+        if len(path) > 1 and offscreen(path, bounds):
+            path = path[:1]
+            count += 1
+        culled.append(path)
+    return culled, count
@@ -0,0 +1,185 @@
+import os
+import re
+import time
+import shutil
+import threading
+
+from render_jobs import read_state, DONE, STALE_RUNNING_SECONDS
+
+# 刚被访问过的文件至少保留这么久（秒），避免客户端拿到链接后文件就被删除
+EVICTION_GRACE = 60
+
+# 任务状态文件名
+STATE_PATTERN = re.compile(r'([0-9a-f]{64})\.json')
+
+# 渲染临时文件和分段目录超过这么久（秒）没有写入，且没有进程在渲染同一个键时，视为遗留文件删除
+LEFTOVER_AGE = STALE_RUNNING_SECONDS
+# 旧版本用tempfile.mkdtemp默认名称创建的分段目录
+LEGACY_SEGMENT_PATTERN = re.compile(r'tmp[a-z0-9_]{8}')
+
+
+def _usage(path):
+    """文件或目录占用的(最近修改时间, 字节数)；目录取其中最新的修改时间"""
+    stat = os.stat(path, follow_symlinks=False)
+    if not os.path.isdir(path) or os.path.islink(path):
+        return stat.st_mtime, stat.st_size
+    mtime, size = stat.st_mtime, 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name), follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            mtime = max(mtime, stat.st_mtime)
+            size += stat.st_size
+    return mtime, size
+
+
+class StorageManager:
+    """
+    限制渲染输出目录的总大小和文件寿命。
+    访问时间记录在文件的atime上（RenderCache.touch），多个web worker共享；
+    后台线程定期扫描，先删除超过max_age未访问的视频，再按最近最少使用顺序删除到max_bytes以内。
+    渲染临时文件和分段目录计入总大小；渲染进程异常退出（OOM、SIGKILL）后留下的这类文件
+    超过LEFTOVER_AGE没有写入、且没有进程在渲染同一个键时删除。
+    指定jobs_folder时同时清理任务状态文件：视频已被删除的已完成任务，以及超过max_age没有更新的任务。
+    """
+
+    def __init__(self, cache, max_bytes, max_age=None, interval=60, jobs_folder=None):
+        self.cache = cache
+        self.jobs_folder = jobs_folder
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.interval = interval
+        self.evicted = 0
+        self._usage = {'bytes': 0, 'files': 0}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def scan(self):
+        """返回[(atime, 字节数, 键)]，按atime从旧到新排列"""
+        entries = []
+        with os.scandir(self.cache.folder) as it:
+            for entry in it:
+                key = self.cache.key_of(entry.name)
+                if key is None or not entry.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_atime, stat.st_size, key))
+        entries.sort()
+        return entries
+
+    def scan_leftovers(self):
+        """返回渲染临时文件和分段目录的[(最近修改时间, 字节数, 文件名)]"""
+        leftovers = []
+        with os.scandir(self.cache.folder) as it:
+            names = [entry.name for entry in it
+                     if self.cache.leftover_key(entry.name) is not None
+                     or (LEGACY_SEGMENT_PATTERN.fullmatch(entry.name) and entry.is_dir())]
+        for name in names:
+            try:
+                mtime, size = _usage(os.path.join(self.cache.folder, name))
+            except FileNotFoundError:
+                continue
+            leftovers.append((mtime, size, name))
+        return leftovers
+
+    def collect_leftovers(self, now=None):
+        """删除遗留的临时文件和分段目录，返回(删除的个数, 仍然保留的字节数)"""
+        now = time.time() if now is None else now
+        removed = kept = 0
+        for mtime, size, name in self.scan_leftovers():
+            if now - mtime > LEFTOVER_AGE:
+                if self.cache.leftover_key(name) is not None:
+                    gone = self.cache.remove_leftover(name)
+                else:
+                    # 旧版本的分段目录无法对应到键，只按修改时间判断
+                    path = os.path.join(self.cache.folder, name)
+                    shutil.rmtree(path, ignore_errors=True)
+                    gone = not os.path.lexists(path)
+                if gone:
+                    removed += 1
+                    continue
+            kept += size
+        return removed, kept
+
+    def collect(self, now=None):
+        """执行一次淘汰，返回删除的文件数"""
+        now = time.time() if now is None else now
+        removed, pending = self.collect_leftovers(now)
+        entries = self.scan()
+        # 正在渲染的临时文件也占用容量，超出时相应地多淘汰旧视频
+        total = pending + sum(size for _, size, _ in entries)
+        evicted = 0
+        for atime, size, key in entries:
+            if now - atime < EVICTION_GRACE:
+                break
+            expired = self.max_age is not None and now - atime > self.max_age
+            if not expired and (self.max_bytes is None or total <= self.max_bytes):
+                break
+            freed = self.cache.evict(key)
+            if freed or not os.path.exists(self.cache.path(key)):
+                total -= size
+                evicted += 1
+        with self._lock:
+            self.evicted += evicted
+            self._usage = {'bytes': total, 'files': len(entries) - evicted,
+                           'temp_bytes': pending}
+        if self.jobs_folder is not None:
+            self.collect_states(now)
+        return removed + evicted
+
+    def collect_states(self, now=None):
+        """删除过期的任务状态文件，返回删除的个数；状态文件不存在时/jobs仍能从渲染缓存中查到结果"""
+        now = time.time() if now is None else now
+        removed = 0
+        with os.scandir(self.jobs_folder) as it:
+            names = [entry.name for entry in it]
+        for name in names:
+            match = STATE_PATTERN.fullmatch(name)
+            if match is None:
+                continue  # 临时文件和准入控制的登记文件
+            state = read_state(self.jobs_folder, match.group(1))
+            if state is None:
+                continue
+            age = now - state.get('updated', 0)
+            if age < EVICTION_GRACE:
+                continue
+            evicted = state['status'] == DONE and not os.path.exists(self.cache.path(match.group(1)))
+            if evicted or (self.max_age is not None and age > self.max_age):
+                try:
+                    os.remove(os.path.join(self.jobs_folder, name))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def usage(self):
+        """最近一次扫描时的占用情况"""
+        with self._lock:
+            return dict(self._usage, max_bytes=self.max_bytes, max_age=self.max_age,
+                        evicted=self.evicted)
+
+    def start(self):
+        """启动后台清理线程；可重复调用，每个进程只启动一个"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='storage-janitor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.collect()
+            except OSError:
+                pass  # 目录暂时不可用时等下一轮
+            self._stop.wait(self.interval)
@@ -0,0 +1,482 @@
+import os
+import time
+import base64
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from io import BytesIO
+import numpy as np
+from PIL import Image
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from glyph_cache import text_polygons
+from font_index import font_index
+from figure_pool import figure_pool, configure_axes
+from ffmpeg_pipe import FFmpegPipeWriter, concat_segments
+from raster import LineRasterizer
+from reveal import RevealSchedule, REVEAL_MODES, complete_frame
+from simplify import simplify_paths, data_tolerance, view_bounds, offscreen, cull_paths, DEFAULT_TOLERANCE_PX
+
+# 默认帧率
+DEFAULT_FPS = 30
+
+# 可选的逐帧渲染后端
+BACKENDS = ('matplotlib', 'numpy')
+
+# 并行渲染时每个分段的最少帧数，太短的分段不值得启动进程
+MIN_CHUNK_FRAMES = 30
+
+# 关键帧拼图预览的默认帧数、每行帧数和缩小倍数
+SPRITE_FRAMES = 8
+SPRITE_COLUMNS = 4
+SPRITE_SCALE = 2
+
+# 分段渲染进程中共享的已完成帧计数
+_chunk_counter = None
+
+
+def _init_chunk_worker(counter):
+    global _chunk_counter
+    _chunk_counter = counter
+
+
+def _count_frame(i):
+    with _chunk_counter.get_lock():
+        _chunk_counter.value += 1
+
+
+def _render_chunk(settings, start, stop, output_path, encoder, hold=0):
+    """在分段渲染进程中渲染并编码[start, stop)范围的帧，最后一帧再重复hold次"""
+    animator = TextAnimation()
+    animator.apply_settings(settings)
+    animator.text_to_paths()
+    try:
+        animator._encode_frames(output_path, start, stop, encoder, _count_frame, hold)
+    finally:
+        animator.close()
+    return animator.timings, animator.counters
+
+def _rgb(frame):
+    """把一帧（RGBA缓冲区、RGB或灰度数组）转换为(高, 宽, 3)的RGB数组"""
+    pixels = np.asarray(frame)
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, None]
+    return np.broadcast_to(pixels[:, :, :3], pixels.shape[:2] + (3,))
+
+class TextAnimation:
+    def __init__(self):
+        # 从进程内的图形池借出预配置好的Agg画布，用完通过close()归还
+        self.fig, self.ax = figure_pool.acquire()
+        
+        # 动画参数
+        self.text = "Hello"
+        self.font_name = "Arial"
+        self.font_size = 72
+        self.line_color = 'white'
+        self.duration = 5  # 动画持续时间（秒）
+        self.fps = DEFAULT_FPS  # 帧率
+        self.frames = self.duration * self.fps
+        self.line_width = 2
+        self.backend = 'matplotlib'  # 逐帧渲染后端
+        self.incremental = False     # 增量模式：每帧只绘制新出现的线段
+        self.reveal_mode = 'arclength'  # 笔画按弧长匀速显示
+        self.simplify_tolerance = DEFAULT_TOLERANCE_PX  # 路径简化允许的误差（像素），0表示不简化
+        
+        # 路径点和动画状态
+        self.paths = []
+        self.points = []
+        self.lines = []
+        self.schedule = None
+        
+        # 各阶段累计耗时（秒）和计数，供监控使用
+        self.timings = {}
+        self.counters = {}
+        
+    def text_to_paths(self):
+        """将文本转换为路径点，并计算所有帧的显示进度表"""
+        self._extract_paths()
+        self._build_schedule()
+    
+    def _extract_paths(self):
+        """取出（并按输出分辨率简化）文本轮廓的多边形"""
+        # 字体查找单独计时（索引查表，首次调用时加载索引）
+        with self._span('font'):
+            font_index.resolve(self.font_name)
+        
+        with self._span('paths'):
+            # 从字形缓存中取出居中后的多边形（至少3个点）
+            self.paths = text_polygons(self.text, self.font_name, self.font_size)
+        
+        self.counters['vertices_in'] = sum(len(path) for path in self.paths)
+        with self._span('simplify'):
+            # 完全在画面以外的路径不需要绘制（字号较大时大部分笔画都在坐标范围以外）
+            self.paths, culled = cull_paths(self.paths, self._view_bounds())
+            # 去掉在输出分辨率下看不出的顶点，之后每帧绘制的顶点数随之减少
+            if self.simplify_tolerance:
+                tolerance = data_tolerance(self.ax, self.simplify_tolerance)
+                self.paths, _, _ = simplify_paths(self.paths, tolerance)
+        self.counters['culled_paths'] = culled
+        self.counters['vertices'] = sum(len(path) for path in self.paths)
+        self.counters['paths'] = len(self.paths)
+    
+    def _view_bounds(self):
+        """线条可能画到的坐标范围：坐标轴范围外加线宽和1像素的抗锯齿边缘"""
+        return view_bounds(self.ax, self.line_width * self.fig.dpi / 72 + 1)
+    
+    def _build_schedule(self, rows=None):
+        """计算显示进度表并创建线条；rows为帧序号时只计算这些帧，进度表第k行对应第rows[k]帧"""
+        with self._span('paths'):
+            # 一次性算出所有帧的显示进度表
+            self.schedule = RevealSchedule(self.paths, self.frames, self.reveal_mode, rows)
+        
+        # 为每个路径创建点和线条
+        self.points = [np.zeros((1, 2)) for _ in self.paths]
+        self.lines = [self.ax.plot([], [], color=self.line_color, lw=self.line_width)[0] 
+                     for _ in self.paths]
+    
+    def init_animation(self):
+        """初始化动画"""
+        for line in self.lines:
+            line.set_data([], [])
+        return self.lines
+    
+    def animate(self, i):
+        """更新每一帧的动画"""
+        for j in np.flatnonzero(self.schedule.counts[i] > 0):
+            # 按进度表取出当前应该显示的部分
+            self.points[j] = self.schedule.visible(i, j)
+            self.lines[j].set_data(self.points[j][:, 0], self.points[j][:, 1])
+        
+        return self.lines
+    
+    def create_animation(self):
+        """创建动画对象"""
+        # 只有交互式预览用到FuncAnimation，服务端不在导入时加载它
+        import matplotlib.animation as animation
+        self.text_to_paths()
+        anim = animation.FuncAnimation(self.fig, self.animate, frames=self.frames,
+                                      init_func=self.init_animation, blit=True)
+        return anim
+    
+    def save_animation(self, output_path="apple_text_animation.mp4", progress_callback=None,
+                       encoder=None, workers=1):
+        """
+        保存动画为视频文件。
+        每帧的像素缓冲区直接写入ffmpeg的rawvideo管道，不经过savefig。
+        progress_callback(已完成帧数, 总帧数)会在每帧写入后调用；
+        encoder为EncoderSettings，指定编码器、CRF、preset和像素格式；
+        workers大于1时把帧范围切成连续的分段，在多个进程中并行渲染后无损拼接。
+        """
+        self.text_to_paths()
+        # 所有笔画画完之后的帧都相同，只渲染到这一帧，剩下的由ffmpeg重复最后一帧
+        rendered = min(self.schedule.complete_frame + 1, self.frames)
+        hold = self.frames - rendered
+        
+        workers = min(workers, rendered // MIN_CHUNK_FRAMES)
+        if workers > 1:
+            self.close()  # 主进程不需要绘图
+            self._save_parallel(output_path, progress_callback, encoder, workers, rendered, hold)
+        else:
+            on_frame = None
+            if progress_callback is not None:
+                on_frame = lambda i: progress_callback(i + 1, self.frames)
+            try:
+                self._encode_frames(output_path, 0, rendered, encoder, on_frame, hold)
+            finally:
+                self.close()  # 归还图形
+        
+        if progress_callback is not None and hold:
+            progress_callback(self.frames, self.frames)
+        self.counters['bytes'] = os.path.getsize(output_path)
+        return output_path
+        
+    def _encode_frames(self, output_path, start, stop, encoder, on_frame=None, hold=0):
+        """渲染[start, stop)范围的帧并编码到output_path，最后一帧再重复hold次"""
+        clock = time.perf_counter
+        begin = clock()
+        width, height, pix_fmt, render_frame = self._frame_renderer()
+        # 绘制时间单独累计，其余（写管道、等待ffmpeg结束）计为编码时间
+        draw = clock() - begin
+        with FFmpegPipeWriter(output_path, width, height, self.fps, encoder,
+                              input_pix_fmt=pix_fmt, hold_frames=hold) as writer:
+            for i in range(start, stop):
+                t = clock()
+                frame = render_frame(i)
+                draw += clock() - t
+                writer.write(frame)
+                if on_frame is not None:
+                    on_frame(i)
+        self.timings['draw'] = self.timings.get('draw', 0.0) + draw
+        self.timings['encode'] = self.timings.get('encode', 0.0) + clock() - begin - draw
+        self.counters['frames'] = self.counters.get('frames', 0) + int(stop - start)
+        
+    def _save_parallel(self, output_path, progress_callback, encoder, workers, rendered, hold):
+        """每个进程渲染并编码一段连续的帧，最后用ffmpeg concat拼接；静止的结尾附在最后一段"""
+        bounds = np.linspace(0, rendered, workers + 1).astype(int)
+        suffix = os.path.splitext(output_path)[1]
+        # 目录名以输出文件名开头，进程异常退出后StorageManager能找到对应的锁并清理
+        segment_dir = tempfile.mkdtemp(prefix=os.path.basename(output_path) + '.segments_',
+                                       dir=os.path.dirname(os.path.abspath(output_path)))
+        segments = [os.path.join(segment_dir, f"segment_{k}{suffix}") for k in range(workers)]
+        
+        ctx = multiprocessing.get_context('spawn')
+        counter = ctx.Value('i', 0)
+        settings = self.get_settings()
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                     initializer=_init_chunk_worker,
+                                     initargs=(counter,)) as executor:
+                futures = [executor.submit(_render_chunk, settings, bounds[k], bounds[k + 1],
+                                           segments[k], encoder,
+                                           hold if k == workers - 1 else 0)
+                           for k in range(workers)]
+                pending = futures
+                while pending:
+                    done, pending = wait(pending, timeout=0.2)
+                    if any(f.exception() is not None for f in done):
+                        for f in pending:
+                            f.cancel()
+                        break
+                    if progress_callback is not None:
+                        progress_callback(counter.value, self.frames)
+                for f in futures:
+                    if not f.cancelled():
+                        self._merge_stats(*f.result())
+            with self._span('concat'):
+                concat_segments(segments, output_path)
+        finally:
+            shutil.rmtree(segment_dir, ignore_errors=True)
+    
+    @contextmanager
+    def _span(self, stage):
+        """把代码块的耗时累加到self.timings[stage]"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0.0) + time.perf_counter() - start
+    
+    def _merge_stats(self, timings, counters):
+        """合并分段渲染进程返回的耗时和计数（各进程的耗时相加）"""
+        for stage, seconds in timings.items():
+            if stage not in ('font', 'paths'):  # 主进程已经计过
+                self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+        self.counters['frames'] = self.counters.get('frames', 0) + counters.get('frames', 0)
+    
+    def _frame_renderer(self):
+        """按所选后端返回(宽, 高, 像素格式, render_frame(i))"""
+        if self.backend == 'numpy':
+            return self._numpy_renderer()
+        return self._matplotlib_renderer()
+    
+    def _matplotlib_renderer(self):
+        """用matplotlib Agg绘制，返回画布的RGBA缓冲区"""
+        self.init_animation()
+        canvas = self.fig.canvas
+        if not isinstance(canvas, FigureCanvasAgg):
+            canvas = FigureCanvasAgg(self.fig)
+        
+        # 先绘制一次不含线条的背景，之后每帧只恢复背景并重绘线条
+        for line in self.lines:
+            line.set_animated(True)
+        canvas.draw()
+        background = canvas.copy_from_bbox(self.fig.bbox)
+        width, height = canvas.get_width_height()
+        
+        if self.incremental:
+            return width, height, 'rgba', self._incremental_matplotlib(canvas, background)
+        
+        # 被剔除的路径只剩一个点，画出来什么也没有，不必逐帧绘制
+        lines = [line for line, path in zip(self.lines, self.paths) if len(path) > 1]
+        
+        def render_frame(i):
+            self.animate(i)
+            canvas.restore_region(background)
+            for line in lines:
+                self.ax.draw_artist(line)
+            return canvas.buffer_rgba()
+        
+        return width, height, 'rgba', render_frame
+    
+    def _incremental_matplotlib(self, canvas, background):
+        """
+        增量绘制：画布在帧之间保留，每帧只把新出现的线段用一个线条对象画上去。
+        各路径的新线段之间用NaN断开，一帧只需一次draw_artist。
+        """
+        ink = self.ax.plot([], [], color=self.line_color, lw=self.line_width, animated=True,
+                           solid_capstyle='round', snap=False)[0]
+        separator = np.full((1, 2), np.nan)
+        previous = [-1]
+        
+        def render_frame(i):
+            if i < previous[0]:
+                # 帧序号回退时从背景重新开始
+                canvas.restore_region(background)
+                previous[0] = -1
+            pieces = []
+            for j in self.schedule.changed(i, previous[0]):
+                pieces += [self.schedule.new_ink(i, j, previous[0]), separator]
+            if pieces:
+                points = np.concatenate(pieces)
+                ink.set_data(points[:, 0], points[:, 1])
+                self.ax.draw_artist(ink)
+            previous[0] = i
+            return canvas.buffer_rgba()
+        
+        return render_frame
+    
+    def _numpy_renderer(self):
+        """用纯NumPy光栅化可见的折线前缀，不经过matplotlib的绘制流程"""
+        rasterizer = LineRasterizer.from_axes(self.ax, self.line_width, self.line_color)
+        pixel_paths = [rasterizer.to_pixels(path) for path in self.paths]
+        schedule = self.schedule
+        
+        if self.incremental:
+            # 覆盖率按最大值合成，增量绘制与整帧重绘一致（末端插值点处最多有1个灰度级的舍入差异）
+            previous = [-1]
+            
+            def render_frame(i):
+                if i < previous[0]:
+                    rasterizer.clear()
+                    previous[0] = -1
+                rasterizer.draw_polylines([schedule.new_ink(i, j, previous[0], pixel_paths)
+                                           for j in schedule.changed(i, previous[0])])
+                previous[0] = i
+                return rasterizer.frame()
+            
+            return rasterizer.width, rasterizer.height, rasterizer.pix_fmt, render_frame
+        
+        def render_frame(i):
+            rasterizer.clear()
+            rasterizer.draw_polylines([schedule.visible(i, j, pixel_paths)
+                                       for j in np.flatnonzero(schedule.counts[i] > 0)])
+            return rasterizer.frame()
+        
+        return rasterizer.width, rasterizer.height, rasterizer.pix_fmt, render_frame
+    
+    def render_preview(self):
+        """渲染完整文本轮廓，返回PNG字节"""
+        # 清除当前图形
+        self.ax.clear()
+        configure_axes(self.ax)
+        
+        # 绘制文本轮廓，跳过完全在画面以外的路径
+        bounds = self._view_bounds()
+        for path in text_polygons(self.text, self.font_name, self.font_size):
+            if offscreen(path, bounds):
+                continue
+            x, y = path[:, 0], path[:, 1]
+            self.ax.plot(x, y, color='white', lw=2)
+        
+        buffer = BytesIO()
+        self.fig.savefig(buffer, format='png', facecolor='black')
+        return buffer.getvalue()
+    
+    def render_sprite_sheet(self, count=SPRITE_FRAMES, columns=SPRITE_COLUMNS, scale=SPRITE_SCALE):
+        """
+        把描绘过程中均匀分布的count帧拼成一张PNG（每行columns帧），返回(PNG字节, 帧序号列表)。
+        最后一帧是所有笔画画完的那一帧。进度表只计算这几帧，与动画时长无关；
+        画布临时按1/scale的分辨率绘制，得到的就是缩略图；
+        帧序号递增，用增量渲染只绘制相邻两帧之间新出现的线段，总开销接近一次完整预览。
+        """
+        if self.frames < 1:
+            raise ValueError("动画至少需要一帧")
+        dpi, incremental = self.fig.dpi, self.incremental
+        self.fig.set_dpi(dpi / scale)
+        self.incremental = True
+        try:
+            # 路径简化的误差按缩略图的像素换算，顶点更少
+            self._extract_paths()
+            last = min(complete_frame(len(self.paths), self.frames), self.frames - 1)
+            indexes = np.unique(np.linspace(last / count, last, count).round().astype(int)).tolist()
+            self._build_schedule(indexes)
+            
+            width, height, _, render_frame = self._frame_renderer()
+            rows = -(-len(indexes) // columns)
+            sheet = np.zeros((rows * height, min(columns, len(indexes)) * width, 3), dtype=np.uint8)
+            for k in range(len(indexes)):
+                row, column = divmod(k, columns)
+                sheet[row * height:(row + 1) * height,
+                      column * width:(column + 1) * width] = _rgb(render_frame(k))
+        finally:
+            self.fig.set_dpi(dpi)
+            self.incremental = incremental
+        
+        # 拼图以黑色背景为主，用最快的压缩级别文件只稍大一些，编码时间少很多
+        buffer = BytesIO()
+        Image.fromarray(sheet).save(buffer, format='png', compress_level=1)
+        return buffer.getvalue(), indexes
+    
+    def generate_preview_image(self):
+        """生成base64编码的预览图像"""
+        return base64.b64encode(self.render_preview()).decode('utf-8')
+        
+    def close(self):
+        """把图形归还到图形池；之后不能再用于绘图"""
+        if self.fig is not None:
+            figure_pool.release(self.fig, self.ax)
+            self.fig = self.ax = None
+            self.lines = []
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def get_settings(self):
+        """返回可在进程间传递的动画参数"""
+        return {
+            'text': self.text,
+            'font_name': self.font_name,
+            'font_size': self.font_size,
+            'line_color': self.line_color,
+            'line_width': self.line_width,
+            'fps': self.fps,
+            'duration': self.duration,
+            'backend': self.backend,
+            'incremental': self.incremental,
+            'reveal_mode': self.reveal_mode,
+            'simplify_tolerance': self.simplify_tolerance,
+        }
+    
+    def apply_settings(self, settings):
+        """应用get_settings()返回的参数"""
+        for name, value in settings.items():
+            setattr(self, name, value)
+        self.set_duration(self.duration)
+        
+    def set_text(self, text):
+        """设置要动画的文本"""
+        self.text = text
+        
+    def set_font(self, font_name, font_size):
+        """设置字体和大小"""
+        self.font_name = font_name
+        self.font_size = font_size
+        
+    def set_duration(self, duration):
+        """设置动画持续时间"""
+        self.duration = duration
+        self.frames = int(self.duration * self.fps)
+        
+    def set_incremental(self, incremental):
+        """设置是否只绘制每帧新出现的线段"""
+        self.incremental = bool(incremental)
+        
+    def set_reveal_mode(self, reveal_mode):
+        """设置笔画显示方式：'arclength'按弧长匀速，'vertices'按顶点数"""
+        if reveal_mode not in REVEAL_MODES:
+            raise ValueError(f"不支持的显示方式: {reveal_mode}")
+        self.reveal_mode = reveal_mode
+        
+    def set_simplify_tolerance(self, tolerance_px):
+        """设置路径简化允许的误差（像素），0表示保留全部顶点"""
+        self.simplify_tolerance = max(0.0, float(tolerance_px))
+        
+    def set_backend(self, backend):
+        """设置逐帧渲染后端：'matplotlib'或'numpy'"""
+        if backend not in BACKENDS:
+            raise ValueError(f"不支持的渲染后端: {backend}")
+        self.backend = backend
@@ -0,0 +1,135 @@
+import json
+from xml.sax.saxutils import escape
+
+from matplotlib import rcParams
+from matplotlib.colors import to_hex, to_rgb
+
+from figure_pool import FIGSIZE, XLIM, YLIM
+from reveal import path_timing
+
+# 不需要光栅化和编码的矢量输出格式
+VECTOR_FORMATS = ('svg', 'lottie')
+
+# 矢量画布每个数据单位对应的像素数（与视频的1000x600画布一致）
+PIXELS_PER_UNIT = 100
+
+
+def stroke_width(line_width):
+    """
+    把以磅为单位的线宽换算成数据单位，使矢量输出的线条粗细与视频中相同。
+    视频中坐标轴占画布宽度的 subplot.right - subplot.left。
+    """
+    axes_inches = FIGSIZE[0] * (rcParams['figure.subplot.right'] - rcParams['figure.subplot.left'])
+    return line_width / 72 / (axes_inches / (XLIM[1] - XLIM[0]))
+
+
+def _canvas_points(path):
+    """数据坐标转换为y轴向下的画布坐标"""
+    x = (path[:, 0] - XLIM[0]) * PIXELS_PER_UNIT
+    y = (YLIM[1] - path[:, 1]) * PIXELS_PER_UNIT
+    return x, y
+
+
+def _svg_path_data(path):
+    """折线的SVG路径描述"""
+    x, y = _canvas_points(path)
+    return 'M' + ' L'.join(f'{a:.2f} {b:.2f}' for a, b in zip(x, y))
+
+
+def _svg_header(line_color, line_width, style=()):
+    """SVG开头：画布、样式、黑色背景和描边属性"""
+    width = (XLIM[1] - XLIM[0]) * PIXELS_PER_UNIT
+    height = (YLIM[1] - YLIM[0]) * PIXELS_PER_UNIT
+    lines = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:g}" height="{height:g}" '
+             f'viewBox="0 0 {width:g} {height:g}">']
+    if style:
+        lines += ['<style>', *style, '</style>']
+    lines += [
+        '<rect width="100%" height="100%" fill="black"/>',
+        f'<g fill="none" stroke="{escape(to_hex(line_color))}" '
+        f'stroke-width="{stroke_width(line_width) * PIXELS_PER_UNIT:.3f}" '
+        f'stroke-linejoin="round">',
+    ]
+    return lines
+
+
+def static_svg(paths, line_color='white', line_width=2):
+    """完整文本轮廓的静态SVG，用作预览图"""
+    lines = _svg_header(line_color, line_width)
+    lines += [f'<path d="{_svg_path_data(path)}"/>' for path in paths]
+    lines += ['</g>', '</svg>']
+    return '\n'.join(lines)
+
+
+def animated_svg(paths, duration, line_color='white', line_width=2):
+    """
+    生成用CSS动画描边的SVG。
+    每条路径用pathLength="1"归一化长度，stroke-dashoffset从1线性变到0，
+    延迟和时长来自path_timing，与视频的逐帧进度一致。
+    """
+    delays, durations = path_timing(len(paths), duration)
+    lines = _svg_header(line_color, line_width, style=(
+        'path { stroke-dasharray: 1 2; stroke-dashoffset: 1; '
+        'animation-name: reveal; animation-timing-function: linear; animation-fill-mode: both; }',
+        '@keyframes reveal { to { stroke-dashoffset: 0; } }',
+    ))
+    for path, delay, length in zip(paths, delays, durations):
+        lines.append(f'<path d="{_svg_path_data(path)}" pathLength="1" '
+                     f'style="animation-delay: {delay:.3f}s; animation-duration: {length:.3f}s"/>')
+    lines.append('</g>')
+    lines.append('</svg>')
+    return '\n'.join(lines)
+
+
+def lottie_json(paths, duration, fps, line_color='white', line_width=2, name='text'):
+    """
+    生成Lottie动画（bodymovin JSON）。
+    每条路径是一个形状组，用Trim Paths的终点从0%线性变到100%实现描边。
+    """
+    width = (XLIM[1] - XLIM[0]) * PIXELS_PER_UNIT
+    height = (YLIM[1] - YLIM[0]) * PIXELS_PER_UNIT
+    frames = int(duration * fps)
+    delays, durations = path_timing(len(paths), duration)
+    color = list(to_rgb(line_color)) + [1]
+    stroke = stroke_width(line_width) * PIXELS_PER_UNIT
+
+    groups = []
+    for j, (path, delay, length) in enumerate(zip(paths, delays, durations)):
+        x, y = _canvas_points(path)
+        vertices = [[round(float(a), 2), round(float(b), 2)] for a, b in zip(x, y)]
+        tangents = [[0, 0]] * len(vertices)
+        start = float(delay) * fps
+        end = float(delay + length) * fps
+        groups.append({
+            'ty': 'gr', 'nm': f'path{j}',
+            'it': [
+                {'ty': 'sh', 'ks': {'a': 0, 'k': {'c': False, 'v': vertices,
+                                                   'i': tangents, 'o': tangents}}},
+                {'ty': 'st', 'c': {'a': 0, 'k': color}, 'o': {'a': 0, 'k': 100},
+                 'w': {'a': 0, 'k': round(stroke, 3)}, 'lc': 1, 'lj': 2},
+                {'ty': 'tm', 's': {'a': 0, 'k': 0}, 'o': {'a': 0, 'k': 0}, 'm': 1,
+                 'e': {'a': 1, 'k': [
+                     {'t': round(start, 3), 's': [0],
+                      'o': {'x': [0], 'y': [0]}, 'i': {'x': [1], 'y': [1]}},
+                     {'t': round(end, 3), 's': [100]},
+                 ]}},
+                {'ty': 'tr', 'p': {'a': 0, 'k': [0, 0]}, 'a': {'a': 0, 'k': [0, 0]},
+                 's': {'a': 0, 'k': [100, 100]}, 'r': {'a': 0, 'k': 0}, 'o': {'a': 0, 'k': 100}},
+            ],
+        })
+
+    transform = {'o': {'a': 0, 'k': 100}, 'r': {'a': 0, 'k': 0}, 'p': {'a': 0, 'k': [0, 0, 0]},
+                 'a': {'a': 0, 'k': [0, 0, 0]}, 's': {'a': 0, 'k': [100, 100, 100]}}
+    animation = {
+        'v': '5.7.0', 'fr': fps, 'ip': 0, 'op': frames, 'w': width, 'h': height,
+        'nm': name, 'ddd': 0, 'assets': [],
+        'layers': [
+            {'ddd': 0, 'ind': 1, 'ty': 4, 'nm': 'strokes', 'sr': 1, 'ks': transform,
+             'ao': 0, 'shapes': groups, 'ip': 0, 'op': frames, 'st': 0, 'bm': 0},
+            # 黑色背景放在最后一层（最底层）
+            {'ddd': 0, 'ind': 2, 'ty': 1, 'nm': 'background', 'sr': 1, 'ks': transform,
+             'ao': 0, 'sc': '#000000', 'sw': width, 'sh': height,
+             'ip': 0, 'op': frames, 'st': 0, 'bm': 0},
+        ],
+    }
+    return json.dumps(animation, ensure_ascii=False, separators=(',', ':'))
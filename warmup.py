@@ -0,0 +1,44 @@
+import time
+import string
+
+# 预热时提取轮廓的字符：常用的ASCII可打印字符
+WARMUP_TEXT = string.ascii_letters + string.digits + string.punctuation
+# 预热的字号：网页表单的默认字号
+WARMUP_SIZES = (72,)
+
+
+def warm_up(text=WARMUP_TEXT, sizes=WARMUP_SIZES):
+    """
+    加载Agg后端、字体索引和常用字形，并完成一次绘制。
+    在gunicorn master中fork之前调用，worker通过写时复制共享这些内存，
+    第一个请求不再承担matplotlib初始化、字体查找和字形提取的开销。
+    返回各步骤耗时（秒）。
+    """
+    timings = {}
+    clock = time.perf_counter
+
+    start = clock()
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.backends.backend_agg import FigureCanvasAgg  # noqa: F401
+    timings['agg'] = clock() - start
+
+    start = clock()
+    from font_index import font_index
+    font_index.load()
+    font_name = font_index.default_family()
+    timings['fonts'] = clock() - start
+
+    start = clock()
+    from glyph_cache import text_polygons
+    for size in sizes:
+        text_polygons(text, font_name, size)
+    timings['glyphs'] = clock() - start
+
+    # 借出一次图形并完整绘制，初始化Agg渲染器和坐标轴的各项缓存
+    start = clock()
+    from figure_pool import figure_pool
+    with figure_pool.figure() as (fig, ax):
+        fig.canvas.draw()
+    timings['figure'] = clock() - start
+    return timings